@@ -0,0 +1,131 @@
+# achievements.py
+"""Ачивки: прогресс пользователей и выданные ачивки хранятся в памяти.
+
+Загружаются один раз при старте (database.load_achievements). Каждое закрытие сессии
+обновляет счетчики пользователя на месте (engine.record) и сравнивает их только со
+следующим невыданным порогом, поэтому в БД пишется лишь действительно полученная ачивка.
+Выданной ачивка считается только после записи в БД (engine.mark_earned): если запись не
+удалась, порог вернется из record при следующем закрытии сессии.
+
+Правило - это счетчик и пороги для него. Новый тип правила - класс с keys() и advance()
+(и best(), если лучший результат может быть больше текущего, как у серии дней).
+"""
+from datetime import date, timedelta
+
+import config
+
+class TotalTime:
+    """Общее время в войсе, секунды (config.ACHIEVEMENTS)."""
+    def __init__(self, levels):
+        self.thresholds = {"total": levels}
+
+    def keys(self, game):
+        return ("total",)
+
+    def advance(self, progress, key, day, seconds):
+        progress[key] = progress.get(key, 0) + seconds
+        return progress[key]
+
+    def best(self, progress, key):
+        return progress.get(key, 0)
+
+class GameTime(TotalTime):
+    """Время в конкретной игре, секунды (config.GAME_ACHIEVEMENTS). Считаются только игры с порогами."""
+    def __init__(self, levels):
+        self.thresholds = {}
+        for (game, seconds), name in levels.items():
+            self.thresholds.setdefault(("game", game), {})[seconds] = name
+
+    def keys(self, game):
+        return (("game", game),) if ("game", game) in self.thresholds else ()
+
+class Streak:
+    """Дней подряд с заходом в войс (config.STREAK_ACHIEVEMENTS)."""
+    def __init__(self, levels):
+        self.thresholds = {"streak": levels}
+
+    def keys(self, game):
+        return ("streak",)
+
+    def advance(self, progress, key, day, seconds):
+        last_day, current, best = progress.get(key, (None, 0, 0))
+        if day != last_day:
+            current = current + 1 if last_day == day - timedelta(days=1) else 1
+            progress[key] = (day, current, max(best, current))
+        return progress[key][1]
+
+    def best(self, progress, key):
+        return progress.get(key, (None, 0, 0))[2]
+
+class AchievementEngine:
+    def __init__(self, rules):
+        self.rules = rules
+        self._levels = {key: sorted(levels.items()) for rule in rules for key, levels in rule.thresholds.items()}
+        self._key_by_name = {name: key for key, levels in self._levels.items() for _, name in levels}
+        self._progress = {}  # user_id -> {ключ счетчика: значение}
+        self._earned = {}  # user_id -> {название ачивки}
+        self._next = {}  # (user_id, ключ счетчика) -> (порог, название) или None
+
+    def tracked_games(self):
+        return [key[1] for key in self._levels if isinstance(key, tuple) and key[0] == "game"]
+
+    def load(self, counters, active_days, earned):
+        """counters: (user_id, ключ, значение); active_days: (user_id, день) по возрастанию дней; earned: (user_id, название)."""
+        self._progress, self._earned, self._next = {}, {}, {}
+        for user_id, key, value in counters:
+            self._progress.setdefault(user_id, {})[key] = value
+        streaks = [rule for rule in self.rules if isinstance(rule, Streak)]
+        for user_id, day in active_days:
+            progress = self._progress.setdefault(user_id, {})
+            for rule in streaks:
+                rule.advance(progress, "streak", date.fromisoformat(day), 0)
+        for user_id, name in earned:
+            self._earned.setdefault(user_id, set()).add(name)
+
+    def earned(self, user_id):
+        return self._earned.get(user_id, set())
+
+    def _next_level(self, user_id, key):
+        cache_key = (user_id, key)
+        if cache_key not in self._next:
+            earned = self.earned(user_id)
+            self._next[cache_key] = next((level for level in self._levels[key] if level[1] not in earned), None)
+        return self._next[cache_key]
+
+    def record(self, user_id, day, game, seconds):
+        """Учитывает закрытую сессию. Возвращает названия пройденных, но еще не выданных ачивок.
+
+        Выданными они не отмечаются: это делает mark_earned после записи в БД.
+        """
+        progress = self._progress.setdefault(user_id, {})
+        crossed = []
+        for rule in self.rules:
+            for key in rule.keys(game):
+                value = rule.advance(progress, key, day, seconds)
+                level = self._next_level(user_id, key)
+                if level and value >= level[0]:
+                    earned = self.earned(user_id)
+                    crossed.extend(name for threshold, name in self._levels[key] if value >= threshold and name not in earned)
+        return crossed
+
+    def pending(self):
+        """Все (user_id, название), на которые пользователи уже наработали, но которые не выданы."""
+        grants = []
+        for user_id, progress in self._progress.items():
+            earned = self.earned(user_id)
+            for rule in self.rules:
+                for key, levels in rule.thresholds.items():
+                    best = rule.best(progress, key)
+                    grants.extend((user_id, name) for seconds, name in sorted(levels.items()) if best >= seconds and name not in earned)
+        return grants
+
+    def mark_earned(self, user_id, name):
+        """Отмечает ачивку выданной (вызывать после записи в БД)."""
+        self._earned.setdefault(user_id, set()).add(name)
+        self._next.pop((user_id, self._key_by_name.get(name)), None)
+
+engine = AchievementEngine([
+    TotalTime(config.ACHIEVEMENTS),
+    GameTime(config.GAME_ACHIEVEMENTS),
+    Streak(config.STREAK_ACHIEVEMENTS),
+])
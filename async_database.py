@@ -0,0 +1,147 @@
+# async_database.py
+"""Асинхронный фасад над database.py.
+
+Все обращения к SQLite выполняются в отдельном пуле потоков, чтобы медленный диск
+не останавливал общий цикл событий Discord и Telegram. Функции повторяют API database.py.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import database
+import metrics
+
+_executor = ThreadPoolExecutor(max_workers=database.READ_POOL_SIZE, thread_name_prefix="nexus-db")
+
+def _timed_call(func, args, kwargs):
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        metrics.inc("nexus_db_errors_total", function=func.__name__)
+        raise
+    finally:
+        metrics.observe("nexus_db_query_seconds", time.perf_counter() - started, function=func.__name__)
+
+async def run(func, *args, **kwargs):
+    """Выполняет произвольную синхронную функцию БД в потоке БД (время выполнения пишется в метрики)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _timed_call, func, args, kwargs)
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+# Операции над сессиями одного пользователя (начало и закрытие) выполняются строго по очереди:
+# иначе закрытие, пришедшее во время записи начала сессии, уйдет в пакет раньше нее
+# и пользователь останется "в войсе" после быстрого выхода -> входа -> выхода
+_user_ops = {}  # user_id -> задача последней операции
+
+def _in_order(user_id, operation):
+    previous = _user_ops.get(user_id)
+
+    async def chained():
+        if previous:
+            await asyncio.wait([previous])
+        return await operation()
+
+    task = asyncio.ensure_future(chained())
+    _user_ops[user_id] = task
+    task.add_done_callback(lambda done: _forget_op(user_id, done))
+    return task
+
+def _forget_op(user_id, task):
+    if _user_ops.get(user_id) is task:
+        del _user_ops[user_id]
+
+# Групповая фиксация закрытий сессий: закрытия, пришедшие в пределах окна, пишутся одной транзакцией
+_pending_closes = []
+_flush_task = None
+
+async def close_voice_session(user_id, user_name, end_time, game_name):
+    """Атомарно закрывает сессию. Возвращает (join_time, duration) или None."""
+    # shield: отмена обработчика не должна нарушить очередь операций пользователя
+    return await asyncio.shield(_in_order(user_id, lambda: _close(user_id, user_name, end_time, game_name)))
+
+async def _close(*args):
+    global _flush_task
+    window = config.GROUP_COMMIT_WINDOW_SECONDS
+    if not window:
+        return await run(database.close_voice_session, *args)
+    future = asyncio.get_running_loop().create_future()
+    _pending_closes.append((args, future))
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_closes(window))
+    return await future
+
+async def _flush_closes(window):
+    global _flush_task
+    await asyncio.sleep(window)
+    batch = _pending_closes[:]
+    _pending_closes.clear()
+    _flush_task = None
+    try:
+        results = await run(database.close_voice_sessions, [args for args, _ in batch])
+    except Exception as e:
+        print(f"ERROR: Не удалось зафиксировать закрытие {len(batch)} сессий: {e}")
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    for (_, future), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result)
+
+async def start_active_session(user_id, join_time):
+    # Быстрый перезаход: новая сессия пишется только после еще не зафиксированного закрытия
+    await asyncio.shield(_in_order(user_id, lambda: run(database.start_active_session, user_id, join_time)))
+
+def shutdown():
+    """Дожидается завершения операций и закрывает соединения."""
+    _executor.shutdown(wait=True)
+    database.close_connections()
+
+# Поиск связей аккаунтов читает карту идентичностей в памяти, поэтому вызывается напрямую, без await
+get_telegram_id_by_discord_id = database.get_telegram_id_by_discord_id
+get_telegram_ids = database.get_telegram_ids
+get_steam_id = database.get_steam_id
+get_discord_id_by_telegram_id = database.get_discord_id_by_telegram_id
+# Таблицы лидеров также читаются из памяти
+get_top_users = database.get_top_users
+get_top_games = database.get_top_games
+get_weekly_king = database.get_weekly_king
+get_user_rank = database.get_user_rank
+get_total_voice_time = database.get_total_voice_time
+verify_leaderboards = _wrap(database.verify_leaderboards)
+
+init_db = _wrap(database.init_db)
+end_active_session = _wrap(database.end_active_session)
+close_voice_sessions = _wrap(database.close_voice_sessions)
+get_all_active_sessions = _wrap(database.get_all_active_sessions)
+reconcile_active_sessions = _wrap(database.reconcile_active_sessions)
+get_cache_last_updated = _wrap(database.get_cache_last_updated)
+set_cache_last_updated = _wrap(database.set_cache_last_updated)
+grant_achievement = _wrap(database.grant_achievement)
+get_top_games_for_user = _wrap(database.get_top_games_for_user)
+get_detailed_daily_sessions = _wrap(database.get_detailed_daily_sessions)
+get_user_achievements = _wrap(database.get_user_achievements)
+set_key_value = _wrap(database.set_key_value)
+set_key_values = _wrap(database.set_key_values)
+get_key_value = _wrap(database.get_key_value)
+add_voice_session = _wrap(database.add_voice_session)
+get_daily_stats = _wrap(database.get_daily_stats)
+backfill_daily_user_stats = _wrap(database.backfill_daily_user_stats)
+link_steam_account = _wrap(database.link_steam_account)
+create_linking_code = _wrap(database.create_linking_code)
+find_discord_id_by_code = _wrap(database.find_discord_id_by_code)
+link_telegram_account = _wrap(database.link_telegram_account)
+delete_linking_code = _wrap(database.delete_linking_code)
+add_expiring_message = _wrap(database.add_expiring_message)
+get_expiring_messages = _wrap(database.get_expiring_messages)
+delete_expiring_messages = _wrap(database.delete_expiring_messages)
+update_stats = _wrap(database.update_stats)
+get_user_stats = _wrap(database.get_user_stats)
@@ -0,0 +1,84 @@
+# benchmarks/http_reuse_check.py
+"""Проверка переиспользования соединений общим HTTP-клиентом на локальном сервере-заглушке.
+
+Запуск: python benchmarks/http_reuse_check.py [--requests 50]
+Заглушка aiohttp считает принятые TCP-соединения (по адресу клиента). Последовательные
+запросы и повтор после 503 должны идти через одно соединение, а параллельные - не больше
+чем через HTTP_MAX_CONNECTIONS_PER_HOST. Для сравнения показывается время с новой сессией
+на каждый запрос (как было до общего клиента).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import http_client
+
+async def start_stub():
+    peers, failures = set(), {"left": 0}
+
+    async def handle(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        if failures["left"]:
+            failures["left"] -= 1
+            return web.Response(status=503)
+        await asyncio.sleep(0.005)
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/", peers, failures
+
+async def check(requests):
+    config.HTTP_RETRY_BACKOFF_SECONDS = 0.01
+    runner, url, peers, failures = await start_stub()
+    try:
+        started = time.perf_counter()
+        for _ in range(requests):
+            assert await http_client.get_json(url) == {"ok": True}
+        shared_seconds = time.perf_counter() - started
+        assert len(peers) == 1, f"последовательные запросы открыли {len(peers)} соединений"
+        print(f"Последовательно: {requests} запросов через {len(peers)} соединение, {shared_seconds * 1000:.0f} мс")
+
+        failures["left"] = 1
+        assert await http_client.get_json(url) == {"ok": True}
+        assert len(peers) == 1, "повтор после 503 открыл новое соединение"
+        print(f"Повтор после 503: соединений по-прежнему {len(peers)}")
+
+        peers.clear()
+        await asyncio.gather(*(http_client.get_json(url) for _ in range(requests)))
+        assert len(peers) <= config.HTTP_MAX_CONNECTIONS_PER_HOST, f"параллельно открыто {len(peers)} соединений"
+        print(f"Параллельно: {requests} запросов через {len(peers)} соединений (предел {config.HTTP_MAX_CONNECTIONS_PER_HOST})")
+        print(f"Счетчики клиента: {http_client.stats}")
+
+        peers.clear()
+        started = time.perf_counter()
+        for _ in range(requests):
+            async with aiohttp.ClientSession() as session, session.get(url) as response:
+                await response.json()
+        print(f"Для сравнения, новая сессия на запрос: {len(peers)} соединений, {(time.perf_counter() - started) * 1000:.0f} мс")
+    finally:
+        await http_client.close()
+        await runner.cleanup()
+    print("OK: соединения переиспользуются.")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50, help="запросов в каждой проверке")
+    args = parser.parse_args()
+    asyncio.run(check(args.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/logging_bench.py
+"""Сколько времени print отнимает у цикла событий: прежняя синхронная запись в файл и консоль
+против очереди с фоновым потоком (log_setup).
+
+Запуск: python benchmarks/logging_bench.py --lines 20000 --lines-per-event 3
+Консоль направляется в /dev/null, поэтому реальный терминал даст прежней схеме еще худший результат.
+"""
+import argparse
+import builtins
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import log_setup
+
+def reset_logging():
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+def sync_setup():
+    """Прежняя схема из main.setup_logging: запись выполняется прямо в вызове print."""
+    os.makedirs('logs', exist_ok=True)
+    log_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    log_handler = RotatingFileHandler('logs/bot.log', maxBytes=5*1024*1024, backupCount=2, encoding='utf-8')
+    log_handler.setFormatter(log_formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(log_formatter)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(log_handler)
+    root.addHandler(console_handler)
+    builtins.print = lambda *args, **kwargs: logging.info(' '.join(map(str, args)))
+
+def measure(lines):
+    """Среднее время одного print в вызывающем потоке, мкс."""
+    token = log_setup.event_fields.set({"handler": "voice_state_update", "user": 1, "guild": 2, "started": time.perf_counter()})
+    started = time.perf_counter()
+    for i in range(lines):
+        print(f"EVENT: Игрок_{i} зашел в канал.")
+    elapsed = time.perf_counter() - started
+    log_setup.event_fields.reset(token)
+    return elapsed / lines * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=20000, help="сколько строк писать в каждом варианте")
+    parser.add_argument("--lines-per-event", type=float, default=3, help="строк лога на одно событие Discord")
+    args = parser.parse_args()
+
+    original_print, original_stderr = builtins.print, sys.stderr
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        os.chdir(tmp)
+        sys.stderr = devnull
+        try:
+            sync_setup()
+            results["синхронно"] = (measure(args.lines), 0.0)
+            reset_logging()
+            for log_format in ("text", "json"):
+                config.LOG_FORMAT = log_format
+                listener = log_setup.setup_logging()
+                per_line = measure(args.lines)
+                drain_started = time.perf_counter()
+                listener.stop()
+                results[f"очередь, {log_format}"] = (per_line, time.perf_counter() - drain_started)
+                reset_logging()
+        finally:
+            builtins.print, sys.stderr = original_print, original_stderr
+
+    baseline = results["синхронно"][0]
+    for name, (per_line, drain) in results.items():
+        saved = (baseline - per_line) * args.lines_per_event
+        print(f"{name}: {per_line:.1f} мкс на строку в цикле событий, дозапись в фоне {drain * 1000:.0f} мс, "
+              f"экономия на событие ({args.lines_per_event:g} строк): {saved:.1f} мкс")
+
+if __name__ == "__main__":
+    main()
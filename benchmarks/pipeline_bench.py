@@ -0,0 +1,157 @@
+# benchmarks/pipeline_bench.py
+"""Нагрузочный бенчмарк цепочки "событие Discord -> статусное сообщение Telegram".
+
+Запуск: python benchmarks/pipeline_bench.py --users 100 --events 2000 --rate 200
+Сначала --users участников одновременно заходят в войс (рейд), затем идут --events
+случайных событий (смена игры, выход/вход) с частотой --rate в секунду (0 - без пауз).
+Обработчики discord_bot вызываются с поддельными участниками на временной БД, Telegram
+заменен заглушкой. Отчет: события/с, задержка от события до завершенного обновления
+сообщения, время БД и отрисовки, число вызовов Telegram.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:bench')
+os.environ['TELEGRAM_CHAT_ID'] = '-100'
+os.environ.pop('TELEGRAM_CHAT_MAP', None)
+
+import async_database as db
+import config
+import database
+import metrics
+from fakes import FakeChannel, FakeGuild, FakeMember, FakeVoiceState, StubTelegramBot
+
+GAMES = ["Dota 2", "Counter-Strike 2", "ELDEN RING™", "Minecraft", None]
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def histogram_line(name):
+    histogram = metrics.merged(name)
+    if not histogram.count:
+        return "нет данных"
+    return (f"{histogram.count} вызовов, всего {histogram.sum * 1000:.0f} мс, "
+            f"среднее {histogram.sum / histogram.count * 1000:.2f} мс, p95 {histogram.format_quantile(0.95)}")
+
+async def drive(args):
+    import discord_bot
+    bot = StubTelegramBot(args.telegram_latency / 1000)
+    discord_bot.telegram_bot = bot
+    discord_bot.edit_scheduler.bot = bot
+    guild, channel = FakeGuild(1), FakeChannel(10)
+    discord_bot.client.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+    monitor = discord_bot.get_monitor(guild)
+
+    # Засечки: когда событие запросило обновление и когда закончилось каждое обновление
+    triggers, updates = [], []
+    original_schedule, original_update = monitor.schedule_update, monitor.debouncer.callback
+    async def schedule_update(*a, **kw):
+        triggers.append(time.perf_counter())
+        await original_schedule(*a, **kw)
+    async def timed_update(**kw):
+        started = time.perf_counter()
+        await original_update(**kw)
+        updates.append((started, time.perf_counter()))
+    monitor.schedule_update, monitor.debouncer.callback = schedule_update, timed_update
+
+    members = [FakeMember(uid, guild) for uid in range(1, args.users + args.users // 2 + 1)]
+    for member in members[::3]:
+        await db.link_steam_account(member.id, str(76561190000000000 + member.id))
+
+    # Состояния до/после фиксируются в момент события, а обработчик выполняется отдельной задачей
+    def join(member):
+        member.voice = FakeVoiceState(channel)
+        return discord_bot.on_voice_state_update(member, FakeVoiceState(), member.voice)
+
+    def leave(member):
+        before, member.voice = member.voice, None
+        return discord_bot.on_voice_state_update(member, before, FakeVoiceState())
+
+    tasks = []
+    started = time.perf_counter()
+    for member in members[:args.users]:
+        tasks.append(asyncio.create_task(join(member)))  # discord.py запускает каждый обработчик отдельной задачей
+    await asyncio.gather(*tasks)
+    raid_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    tasks, counts = [], {"presence": 0, "join": 0, "leave": 0}
+    churn_started = time.perf_counter()
+    for i in range(args.events):
+        in_voice = [m for m in members if m.voice]
+        if in_voice and rng.random() < args.presence_ratio:
+            member, kind = rng.choice(in_voice), "presence"
+            tasks.append(asyncio.create_task(discord_bot.on_presence_update(member, member.play(rng.choice(GAMES)))))
+        else:
+            member = rng.choice(members)
+            kind = "leave" if member.voice else "join"
+            tasks.append(asyncio.create_task(leave(member) if member.voice else join(member)))
+        counts[kind] += 1
+        if args.rate:
+            await asyncio.sleep(max(0.0, churn_started + (i + 1) / args.rate - time.perf_counter()))
+        elif i % 100 == 99:
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    churn_seconds = time.perf_counter() - churn_started
+
+    while not monitor.debouncer.idle:
+        await asyncio.sleep(0.05)
+
+    latencies, i = [], 0
+    for trigger in sorted(triggers):
+        while i < len(updates) and updates[i][0] < trigger:
+            i += 1
+        if i < len(updates):
+            latencies.append(updates[i][1] - trigger)
+
+    calls = {}
+    for method, _ in bot.calls:
+        calls[method] = calls.get(method, 0) + 1
+    total_events = args.users + args.events
+    print(f"Участников: {len(members)}, в войсе после прогона: {len(monitor.voice_users)} "
+          f"(должно быть {sum(1 for m in members if m.voice)})")
+    print(f"Рейд: {args.users} входов за {raid_seconds * 1000:.0f} мс ({args.users / raid_seconds:.0f} событий/с)")
+    print(f"Поток: {counts} за {churn_seconds:.2f} с ({args.events / churn_seconds:.0f} событий/с)")
+    print(f"Запросов обновления: {len(triggers)}, обновлений: {len(updates)}, {monitor.debouncer.stats}")
+    print(f"Задержка событие -> сообщение: p50 {percentile(latencies, 0.5) * 1000:.0f} мс, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.0f} мс, максимум {max(latencies, default=0) * 1000:.0f} мс")
+    print(f"Обработчики Discord: {histogram_line('nexus_discord_event_seconds')}")
+    print(f"БД: {histogram_line('nexus_db_query_seconds')}")
+    print(f"Отрисовка: {histogram_line('nexus_render_seconds')}")
+    print(f"Telegram: {sum(calls.values())} вызовов {calls}, {discord_bot.edit_scheduler.stats}")
+    print(f"Присутствие: {discord_bot.presence_stats}")
+    print(f"Всего событий: {total_events}")
+    monitor.debouncer.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100, help="сколько участников заходят в войс в начале")
+    parser.add_argument("--events", type=int, default=2000, help="число событий после рейда")
+    parser.add_argument("--rate", type=float, default=200, help="событий в секунду (0 - без пауз)")
+    parser.add_argument("--presence-ratio", type=float, default=0.7, help="доля событий смены игры")
+    parser.add_argument("--telegram-latency", type=float, default=50, help="задержка ответа заглушки Telegram, мс")
+    parser.add_argument("--debounce", type=float, default=config.STATUS_DEBOUNCE_SECONDS, help="пауза отложенного обновления, с")
+    parser.add_argument("--max-wait", type=float, default=config.STATUS_DEBOUNCE_MAX_WAIT_SECONDS, help="максимальное ожидание обновления, с")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config.QUIET_HOURS_ENABLED = False
+    config.STATUS_DEBOUNCE_SECONDS, config.STATUS_DEBOUNCE_MAX_WAIT_SECONDS = args.debounce, args.max_wait
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "bench.db")
+        database.init_db()
+        asyncio.run(drive(args))
+        db.shutdown()
+        database.close_connections()
+
+if __name__ == "__main__":
+    main()
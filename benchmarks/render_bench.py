@@ -0,0 +1,79 @@
+# benchmarks/render_bench.py
+"""Микробенчмарк отрисовки статусного сообщения.
+
+Запуск: python benchmarks/render_bench.py [число пользователей в войсе] [число итераций]
+Сравнивает отрисовку без кэшей (каждый раз с нуля) и инкрементальную отрисовку
+с кэшированными фрагментами на временной БД.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:bench')
+
+import async_database as db
+import database
+import steam_catalog
+import utils
+from guild_monitor import GuildMonitor
+from status_renderer import StatusRenderer
+
+monitor = GuildMonitor(1, '-100', bot=None, edit_scheduler=None)
+
+GAMES = ["Dota 2", "Counter-Strike 2", "ELDEN RING™", "Minecraft", "Неизвестно"]
+
+def prepare(users):
+    database.init_db()
+    database.begin_steam_apps_staging()
+    database.stage_steam_apps([(i, name, steam_catalog.normalize_name(name)) for i, name in enumerate(GAMES[:3], 1)])
+    database.apply_steam_apps_staging()
+    database.drop_steam_apps_staging()
+    now = datetime.now(utils.MOSCOW_TZ)
+    for uid in range(1, users * 2):
+        database.link_steam_account(uid, str(76561190000000000 + uid))
+        if uid % 2:
+            database.link_telegram_account(uid, 1000 + uid)
+    # Половина пользователей уже была сегодня в войсе и вышла
+    for uid in range(users + 1, users * 2):
+        database.start_active_session(uid, now - timedelta(minutes=uid))
+    database.close_voice_sessions([(uid, f"Вышедший {uid}", now, GAMES[uid % len(GAMES)]) for uid in range(users + 1, users * 2)])
+    for uid in range(1, users + 1):
+        monitor.voice_users[uid] = {
+            "name": f"Игрок_{uid}", "join_time": now - timedelta(minutes=uid), "game": GAMES[uid % len(GAMES)],
+            "video": uid % 7 == 0, "streaming": uid % 11 == 0,
+        }
+
+async def measure(iterations, cold):
+    timings = []
+    for _ in range(iterations):
+        if cold:
+            monitor.renderer = StatusRenderer()
+            steam_catalog.clear_resolver_cache()
+        started = time.perf_counter()
+        await monitor.format_message()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return sum(timings) / len(timings), timings[int(len(timings) * 0.95) - 1]
+
+async def main(users, iterations):
+    cold_avg, cold_p95 = await measure(iterations, cold=True)
+    monitor.renderer = StatusRenderer()
+    await monitor.format_message()
+    warm_avg, warm_p95 = await measure(iterations, cold=False)
+    print(f"Пользователей в войсе: {users}, итераций: {iterations}")
+    print(f"Без кэша:      среднее {cold_avg:.2f} мс, p95 {cold_p95:.2f} мс")
+    print(f"Инкрементально: среднее {warm_avg:.2f} мс, p95 {warm_p95:.2f} мс")
+    print(f"Фрагменты: {monitor.renderer.stats}, кэш игр: {steam_catalog.resolver_stats}")
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "bench.db")
+        prepare(users)
+        asyncio.run(main(users, iterations))
+        db.shutdown()
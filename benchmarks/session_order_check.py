@@ -0,0 +1,70 @@
+# benchmarks/session_order_check.py
+"""Проверка порядка операций над сессиями при групповой фиксации закрытий.
+
+Запуск: python benchmarks/session_order_check.py [--bursts 20]
+Участник выходит, перезаходит и снова выходит быстрее окна GROUP_COMMIT_WINDOW_SECONDS
+(обработчики идут отдельными задачами, как в discord.py). После этого он не должен
+оставаться ни в voice_users, ни в active_sessions. Проверка повторяется и с окном 0.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:bench')
+os.environ['TELEGRAM_CHAT_ID'] = '-100'
+os.environ.pop('TELEGRAM_CHAT_MAP', None)
+
+import async_database as db
+import config
+import database
+from fakes import FakeChannel, FakeGuild, FakeMember, FakeVoiceState, StubTelegramBot
+
+async def check(bursts):
+    import discord_bot
+    discord_bot.telegram_bot = discord_bot.edit_scheduler.bot = StubTelegramBot()
+    guild, channel = FakeGuild(1), FakeChannel(10)
+    discord_bot.client.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+    monitor = discord_bot.get_monitor(guild)
+    members = [FakeMember(uid, guild) for uid in range(1, bursts + 1)]
+
+    def join(member):
+        member.voice = FakeVoiceState(channel)
+        return asyncio.create_task(discord_bot.on_voice_state_update(member, FakeVoiceState(), member.voice))
+
+    def leave(member):
+        before, member.voice = member.voice, None
+        return asyncio.create_task(discord_bot.on_voice_state_update(member, before, FakeVoiceState()))
+
+    await asyncio.gather(*(join(member) for member in members))
+    tasks = []
+    for member in members:
+        tasks += [leave(member), join(member), leave(member)]
+    await asyncio.gather(*tasks)
+
+    active = [row[0] for row in await db.get_all_active_sessions()]
+    assert not monitor.voice_users, f"в voice_users остались {sorted(monitor.voice_users)}"
+    assert not active, f"в active_sessions остались {sorted(active)}"
+    monitor.debouncer.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bursts", type=int, default=20, help="участников с выходом -> входом -> выходом")
+    args = parser.parse_args()
+
+    config.QUIET_HOURS_ENABLED = False
+    for window in (config.GROUP_COMMIT_WINDOW_SECONDS, 0):
+        config.GROUP_COMMIT_WINDOW_SECONDS = window
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DB_FILE = os.path.join(tmp, "check.db")
+            database.init_db()
+            asyncio.run(check(args.bursts))
+            database.close_connections()
+        print(f"Окно {window} с: {args.bursts} участников вышли, перезашли и вышли - в войсе никого.")
+    db.shutdown()
+    print("OK: операции над сессиями выполняются по порядку.")
+
+if __name__ == "__main__":
+    main()
@@ -24,5 +24,87 @@ ACHIEVEMENTS = {
     3600000: "Старожил",
 }
 
+# Достижения за время в конкретной игре: (игра, секунды) -> название,
+# например ("Dota 2", 360000): "Ветеран Dota 2"
+GAME_ACHIEVEMENTS = {}
+
+# Достижения за серию дней подряд с заходом в войс (в днях)
+STREAK_ACHIEVEMENTS = {
+    7: "Неделя без пропусков",
+    30: "Месяц в строю",
+}
+
 # Кулдаун для новой сессии при быстром перезаходе (в секундах)
 NEW_SESSION_COOLDOWN_SECONDS = 60
+
+# Мониторинг задержек цикла событий: период замера (0 - выключено), порог "блокировки" и период отчета в лог
+LOOP_LAG_MONITOR_INTERVAL = 0.25
+LOOP_LAG_BLOCKED_THRESHOLD_MS = 50
+LOOP_LAG_REPORT_SECONDS = 300
+
+# Отложенное обновление статусного сообщения: пауза после последнего события и максимальное ожидание (в секундах)
+STATUS_DEBOUNCE_SECONDS = 2
+STATUS_DEBOUNCE_MAX_WAIT_SECONDS = 10
+
+# Минимальный интервал обработки смены игры одного пользователя (в секундах); промежуточные смены отбрасываются
+PRESENCE_THROTTLE_SECONDS = 10
+
+# Локальная точка выдачи метрик в формате Prometheus (порт 0 - выключено)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# Журнал входящих событий для воспроизведения (пусто - выключен) и период сброса буфера на диск (в секундах)
+JOURNAL_FILE = os.getenv('JOURNAL_FILE', '')
+JOURNAL_FLUSH_SECONDS = 5
+
+# Формат лога: text или json (JSON-строки с полями обработчика события) и как часто
+# выводить частые однотипные строки, например плановое обновление таймеров (в секундах)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_SAMPLE_SECONDS = 300
+
+# Как часто отметки о работе (последний успех Discord/Telegram/Steam) сохраняются в БД (в секундах)
+HEALTH_FLUSH_SECONDS = 30
+
+# Фоновые замеры для /status: период замеров нагрузки, период пингов API (в секундах) и длина окна (в минутах)
+HEALTH_SAMPLE_SECONDS = 15
+HEALTH_PING_SECONDS = 60
+HEALTH_WINDOW_MINUTES = 15
+
+# Ответы на команды в Telegram: через сколько секунд удаляются и на каких секундах обновляется отсчет
+EPHEMERAL_MESSAGE_TTL_SECONDS = 60
+EPHEMERAL_COUNTDOWN_MARKS = (30, 10)
+
+# Окно групповой фиксации закрытий сессий (в секундах, 0 - фиксировать каждое закрытие сразу)
+GROUP_COMMIT_WINDOW_SECONDS = 0.05
+
+# Поиск игр Steam по названию: размер LRU-кэша и нечеткое сопоставление (порог похожести 0..1).
+# Нечеткий поиск выключен по умолчанию: близкие названия разных игр легко перепутать
+STEAM_RESOLVER_CACHE_SIZE = 4096
+STEAM_FUZZY_MATCH_ENABLED = False
+STEAM_FUZZY_MATCH_CUTOFF = 0.9
+
+# Фоновый опрос статусов Steam: обычный интервал, минимальный промежуток между опросами и предел паузы при ошибках (в секундах)
+STEAM_POLL_INTERVAL_SECONDS = 30
+STEAM_POLL_MIN_GAP_SECONDS = 5
+STEAM_POLL_MAX_BACKOFF_SECONDS = 600
+
+# Общий HTTP-клиент: таймаут запроса, пул соединений, keep-alive и повторы временных ошибок
+HTTP_TIMEOUT_SECONDS = 10
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_CONNECTIONS_PER_HOST = 4
+HTTP_KEEPALIVE_SECONDS = 60
+HTTP_RETRIES = 2
+HTTP_RETRY_BACKOFF_SECONDS = 0.5
+
+# Лимиты Telegram на один чат: сообщений в минуту, допустимый всплеск и число попыток после RetryAfter
+TELEGRAM_CHAT_MESSAGES_PER_MINUTE = 20
+TELEGRAM_CHAT_BURST = 3
+TELEGRAM_RETRY_AFTER_MAX_ATTEMPTS = 3
+
+# Хранение истории сессий: старше скольки дней сворачивать в помесячные итоги, размер пачки,
+# пауза между пачками (в секундах), период запуска (в часах) и шаг incremental vacuum (в страницах)
+SESSION_RETENTION_DAYS = 180
+COMPACTION_BATCH_SIZE = 500
+COMPACTION_PAUSE_SECONDS = 0.2
+COMPACTION_INTERVAL_HOURS = 24
+INCREMENTAL_VACUUM_PAGES = 256
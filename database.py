@@ -1,20 +1,129 @@
 # database.py
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+import achievements
+import leaderboard
+
 DB_FILE = "voice_stats.db"
 
+# Пул соединений: один писатель (запись сериализуется блокировкой) и несколько читателей.
+# В режиме WAL читатели не блокируют писателя, поэтому чтения идут через отдельные соединения.
+READ_POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 256
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+_writer = None
+_write_lock = threading.RLock()
+_readers = queue.LifoQueue()
+_readers_lock = threading.Lock()
+_all_readers = []
+_local = threading.local()
+
+def _connect():
+    # isolation_level=None: автокоммит, транзакции открываются явно через transaction()
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        _writer = _connect()
+        # Действует только для новой БД; существующая переводится в этот режим командой python manage.py compact
+        _writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        _writer.execute("PRAGMA journal_mode = WAL")
+    return _writer
+
+@contextmanager
+def _reader():
+    try:
+        conn = _readers.get_nowait()
+    except queue.Empty:
+        with _readers_lock:
+            conn = _connect() if len(_all_readers) < READ_POOL_SIZE else None
+            if conn is not None:
+                _all_readers.append(conn)
+        if conn is None:
+            conn = _readers.get()
+    try:
+        yield conn
+    finally:
+        _readers.put(conn)
+
+@contextmanager
+def transaction():
+    """Открывает транзакцию на соединении писателя. Вложенные вызовы используют внешнюю транзакцию."""
+    with _write_lock:
+        conn = _get_writer()
+        if getattr(_local, 'in_transaction', False):
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        _local.in_transaction = True
+        callbacks = _local.after_commit = []
+        try:
+            yield conn
+            # Неудачная фиксация (SQLITE_BUSY, ошибка ввода-вывода) тоже откатывается: иначе писатель
+            # остался бы в открытой транзакции и следующие записи молча не фиксировались бы
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _local.in_transaction = False
+            _local.after_commit = []
+        for callback in callbacks:
+            callback()
+
+def _after_commit(callback):
+    """Выполняет callback после фиксации текущей транзакции (или сразу, если транзакции нет)."""
+    if getattr(_local, 'in_transaction', False):
+        _local.after_commit.append(callback)
+    else:
+        callback()
+
+def close_connections():
+    """Закрывает все соединения пула (при остановке или смене DB_FILE)."""
+    global _writer
+    with _readers_lock:
+        while _all_readers:
+            _all_readers.pop().close()
+        while not _readers.empty():
+            _readers.get_nowait()
+    with _write_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+def _is_read_only(sql):
+    return sql.lstrip().upper().startswith('SELECT')
+
 def query(sql, params=(), fetchone=False, commit=False):
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.cursor().execute("PRAGMA foreign_keys = ON;")
-        cursor = conn.cursor()
-        cursor.execute(sql, params)
+    is_select = _is_read_only(sql)
+    # Внутри транзакции читаем через писателя, чтобы видеть собственные незафиксированные изменения
+    if is_select and not getattr(_local, 'in_transaction', False):
+        with _reader() as conn:
+            cursor = conn.execute(sql, params)
+            return (cursor.fetchone() if fetchone else cursor.fetchall()), cursor.rowcount
+    # Запись (или чтение внутри открытой транзакции) идет через писателя; в режиме автокоммита
+    # каждый оператор фиксируется сразу, так что флаг commit сохранен для совместимости.
+    with _write_lock:
+        cursor = _get_writer().execute(sql, params)
         rowcount = cursor.rowcount
-        if commit:
-            conn.commit()
         if fetchone:
             return cursor.fetchone(), rowcount
-        is_select = sql.strip().upper().startswith('SELECT')
         if is_select:
             return cursor.fetchall(), rowcount
         return None, rowcount
@@ -30,16 +139,63 @@ def init_db():
     _execute_query('CREATE INDEX IF NOT EXISTS idx_steam_apps_name ON steam_apps(name)')
     _execute_query('CREATE TABLE IF NOT EXISTS cache_info (key TEXT PRIMARY KEY, last_updated TIMESTAMP)')
     _execute_query('CREATE TABLE IF NOT EXISTS active_sessions (user_id INTEGER PRIMARY KEY, join_time TIMESTAMP NOT NULL)')
+    _execute_query('CREATE TABLE IF NOT EXISTS expiring_messages (chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, base_text TEXT NOT NULL, parse_mode TEXT, expires_at REAL NOT NULL, PRIMARY KEY (chat_id, message_id))')
+    _execute_query('CREATE INDEX IF NOT EXISTS idx_voice_sessions_start_time ON voice_sessions(start_time)')
+    _execute_query('CREATE INDEX IF NOT EXISTS idx_voice_sessions_user_id ON voice_sessions(user_id)')
+    _execute_query('CREATE TABLE IF NOT EXISTS voice_sessions_monthly (month TEXT NOT NULL, user_id INTEGER NOT NULL, game_name TEXT NOT NULL, total_seconds INTEGER DEFAULT 0, sessions INTEGER DEFAULT 0, PRIMARY KEY (month, user_id, game_name))')
+    rollup_exists, _ = query("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_user_stats'", fetchone=True)
+    _execute_query('CREATE TABLE IF NOT EXISTS daily_user_stats (day TEXT NOT NULL, user_id INTEGER NOT NULL, game_name TEXT NOT NULL, total_seconds INTEGER DEFAULT 0, sessions INTEGER DEFAULT 0, PRIMARY KEY (day, user_id, game_name))')
     try:
         _execute_query('SELECT game_name FROM voice_sessions LIMIT 1')
     except sqlite3.OperationalError:
         _execute_query('ALTER TABLE voice_sessions ADD COLUMN game_name TEXT')
+    try:
+        _execute_query('SELECT norm_name FROM steam_apps LIMIT 1')
+    except sqlite3.OperationalError:
+        _execute_query('ALTER TABLE steam_apps ADD COLUMN norm_name TEXT')
+        # Нормализованные имена заполнит ближайшее обновление каталога
+        _execute_query("DELETE FROM cache_info WHERE key = 'steam_apps'")
+    _execute_query('CREATE INDEX IF NOT EXISTS idx_steam_apps_norm_name ON steam_apps(norm_name)')
+    if not rollup_exists:
+        print(f"    -> Дневная сводка создана по истории сессий: {backfill_daily_user_stats()} строк.")
+    load_identity_map()
+    load_leaderboards()
+    load_achievements()
     print("    -> База данных (v.PersistentMemory) инициализирована.")
 
 def _execute_query(sql, params=()):
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.execute(sql, params)
-        conn.commit()
+    with _write_lock:
+        _get_writer().execute(sql, params)
+
+# --- Карта идентичностей Discord <-> Telegram <-> Steam ---
+# Загружается целиком при старте и поддерживается функциями привязки, поэтому поиск связей
+# при отрисовке статуса не обращается к БД.
+_telegram_by_discord = {}
+_discord_by_telegram = {}
+_steam_by_discord = {}
+
+# Один Telegram-аккаунт связан не более чем с одним пользователем Discord: новая привязка
+# снимает прежнюю (link_telegram_account), и карта при загрузке следует тому же правилу.
+
+def load_identity_map():
+    results, _ = query("SELECT id, telegram_id, steam_id FROM users WHERE telegram_id IS NOT NULL OR steam_id IS NOT NULL ORDER BY id")
+    _telegram_by_discord.clear(); _discord_by_telegram.clear(); _steam_by_discord.clear()
+    duplicates = 0
+    for discord_id, telegram_id, steam_id in results:
+        if telegram_id:
+            # Повторы остались от привязок до введения правила; порядок их привязки неизвестен,
+            # поэтому остается пользователь с наибольшим ID, как и при любом следующем запуске
+            previous = _discord_by_telegram.get(telegram_id)
+            if previous is not None:
+                del _telegram_by_discord[previous]
+                duplicates += 1
+            _telegram_by_discord[discord_id] = telegram_id
+            _discord_by_telegram[telegram_id] = discord_id
+        if steam_id:
+            _steam_by_discord[discord_id] = steam_id
+    print(f"    -> Загружено связей аккаунтов: Telegram {len(_telegram_by_discord)}, Steam {len(_steam_by_discord)}.")
+    if duplicates:
+        print(f"ERROR: {duplicates} Telegram-аккаунтов привязаны к нескольким пользователям Discord; учтена одна привязка. Повторите /link.")
 
 def start_active_session(user_id, join_time):
     query("INSERT OR REPLACE INTO active_sessions (user_id, join_time) VALUES (?, ?)", (user_id, join_time.isoformat()), commit=True)
@@ -55,6 +211,30 @@ def get_all_active_sessions():
     results, _ = query("SELECT user_id, join_time FROM active_sessions")
     return [(uid, datetime.fromisoformat(jt)) for uid, jt in results]
 
+def reconcile_active_sessions(present_ids, now, connected_ids=()):
+    """Сверяет active_sessions с теми, кто сейчас в войсе, одной транзакцией (после переподключения).
+
+    Сессии ушедших закрываются как раньше (в историю с игрой "Неизвестно"), для новых из present_ids
+    открываются с временем now. connected_ids - кто в войсе на серверах без монитора: их сессии
+    не закрываются, но и не открываются. Возвращает ({user_id: join_time} для present_ids, [закрытые user_id]).
+    """
+    present_ids, connected_ids = set(present_ids), set(connected_ids)
+    sessions, closed = {}, []
+    with transaction() as conn:
+        for user_id, join_time in get_all_active_sessions():
+            if user_id in present_ids:
+                sessions[user_id] = join_time
+                continue
+            if user_id in connected_ids:
+                continue
+            conn.execute("DELETE FROM active_sessions WHERE user_id = ?", (user_id,))
+            add_voice_session(user_id, join_time, (now - join_time).total_seconds(), 'Неизвестно')
+            closed.append(user_id)
+        started = [(user_id, now.isoformat()) for user_id in present_ids - sessions.keys()]
+        conn.executemany("INSERT INTO active_sessions (user_id, join_time) VALUES (?, ?)", started)
+        sessions.update((user_id, now) for user_id, _ in started)
+    return sessions, closed
+
 def get_cache_last_updated(key: str):
     result, _ = query("SELECT last_updated FROM cache_info WHERE key = ?", (key,), fetchone=True)
     return datetime.fromisoformat(result[0]) if result else None
@@ -62,36 +242,69 @@ def get_cache_last_updated(key: str):
 def set_cache_last_updated(key: str):
     query("INSERT OR REPLACE INTO cache_info (key, last_updated) VALUES (?, ?)", (key, datetime.now().isoformat()), commit=True)
 
-def update_steam_apps(apps: list):
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM steam_apps")
-        cursor.executemany("INSERT OR IGNORE INTO steam_apps (appid, name) VALUES (?, ?)", apps)
-        conn.commit()
-    print(f"INFO: Успешно кэшировано {len(apps)} приложений Steam в БД.")
+def begin_steam_apps_staging():
+    # Обычная таблица в файле БД, а не TEMP: при temp_store = MEMORY весь каталог (~200 тыс. строк)
+    # с индексом лежал бы в памяти процесса. После применения таблица удаляется
+    _execute_query('CREATE TABLE IF NOT EXISTS steam_apps_staging (appid INTEGER PRIMARY KEY, name TEXT, norm_name TEXT)')
+    _execute_query('DELETE FROM steam_apps_staging')
+
+def stage_steam_apps(apps: list):
+    with transaction() as conn:
+        conn.executemany("INSERT OR REPLACE INTO steam_apps_staging (appid, name, norm_name) VALUES (?, ?, ?)", apps)
+
+def apply_steam_apps_staging():
+    """Одной транзакцией приводит steam_apps к содержимому промежуточной таблицы. Возвращает число измененных строк."""
+    with transaction() as conn:
+        removed = conn.execute("DELETE FROM steam_apps WHERE appid NOT IN (SELECT appid FROM steam_apps_staging)").rowcount
+        renamed = conn.execute(
+            "UPDATE steam_apps SET (name, norm_name) = (SELECT s.name, s.norm_name FROM steam_apps_staging s WHERE s.appid = steam_apps.appid) "
+            "WHERE appid IN (SELECT s.appid FROM steam_apps_staging s JOIN steam_apps a ON a.appid = s.appid "
+            "WHERE a.name IS NOT s.name COLLATE BINARY OR a.norm_name IS NOT s.norm_name)"
+        ).rowcount
+        added = conn.execute(
+            "INSERT INTO steam_apps (appid, name, norm_name) SELECT s.appid, s.name, s.norm_name FROM steam_apps_staging s "
+            "WHERE NOT EXISTS (SELECT 1 FROM steam_apps a WHERE a.appid = s.appid)"
+        ).rowcount
+    return {"added": added, "renamed": renamed, "removed": removed}
+
+def drop_steam_apps_staging():
+    _execute_query('DROP TABLE IF EXISTS steam_apps_staging')
 
 def get_steam_app_id(game_name: str):
     sql = "SELECT appid FROM steam_apps WHERE name = ? LIMIT 1"
     result, _ = query(sql, (game_name,), fetchone=True)
     return result[0] if result else None
 
+def get_steam_app_id_by_norm_name(norm_name: str):
+    result, _ = query("SELECT appid FROM steam_apps WHERE norm_name = ? ORDER BY appid LIMIT 1", (norm_name,), fetchone=True)
+    return result[0] if result else None
+
+def get_steam_app_candidates(norm_prefix: str, limit=500):
+    """Приложения, нормализованное имя которых начинается с norm_prefix (кандидаты для нечеткого поиска)."""
+    results, _ = query("SELECT appid, norm_name FROM steam_apps WHERE norm_name >= ? AND norm_name < ? LIMIT ?", (norm_prefix, norm_prefix + '\uffff', limit))
+    return results
+
 def grant_achievement(user_id, achievement) -> bool:
     _, rowcount = query('INSERT OR IGNORE INTO achievements (user_id, achievement) VALUES (?, ?)', (user_id, achievement), commit=True)
     return rowcount > 0
 
 def get_top_games_for_user(user_id, limit=3):
-    sql = "SELECT game_name, SUM(duration_seconds) as total_time FROM voice_sessions WHERE user_id = ? AND game_name IS NOT NULL AND game_name != 'Неизвестно' GROUP BY game_name ORDER BY total_time DESC LIMIT ?"
-    results, _ = query(sql, (user_id, limit))
+    # Старая история хранится помесячно в voice_sessions_monthly (см. compact_voice_sessions_batch)
+    sql = ("SELECT game_name, SUM(seconds) as total_time FROM ("
+           "SELECT game_name, duration_seconds AS seconds FROM voice_sessions WHERE user_id = ? "
+           "UNION ALL SELECT game_name, total_seconds FROM voice_sessions_monthly WHERE user_id = ?"
+           ") WHERE game_name IS NOT NULL AND game_name NOT IN ('', 'Неизвестно') GROUP BY game_name ORDER BY total_time DESC LIMIT ?")
+    results, _ = query(sql, (user_id, user_id, limit))
     return results
 
 def get_top_users(limit=15):
-    sql = f"SELECT name, total_seconds, telegram_id FROM users WHERE total_seconds > 0 ORDER BY total_seconds DESC LIMIT {limit}"
-    results, _ = query(sql)
-    return results
+    return [(name, secs, _telegram_by_discord.get(uid)) for uid, name, secs in leaderboard.users.top(limit)]
+
+def get_user_rank(user_id):
+    return leaderboard.users.rank(user_id)
 
 def get_total_voice_time():
-    result, _ = query("SELECT SUM(total_seconds) FROM users", fetchone=True)
-    return result[0] if result and result[0] is not None else 0
+    return sum(leaderboard.users.snapshot().values())
 
 def get_detailed_daily_sessions(day_start_time):
     sql = "SELECT u.id, u.name, u.telegram_id, vs.start_time, vs.duration_seconds, vs.game_name FROM voice_sessions vs JOIN users u ON u.id = vs.user_id WHERE vs.start_time >= ? ORDER BY u.name, vs.start_time"
@@ -105,28 +318,112 @@ def get_user_achievements(user_id):
 def set_key_value(key, value):
     query("INSERT OR REPLACE INTO key_value_store (key, value) VALUES (?, ?)", (key, str(value)), commit=True)
 
+def set_key_values(items):
+    """items: [(ключ, значение)] одной транзакцией."""
+    with transaction() as conn:
+        conn.executemany("INSERT OR REPLACE INTO key_value_store (key, value) VALUES (?, ?)", [(key, str(value)) for key, value in items])
+
 def get_key_value(key):
     result, _ = query("SELECT value FROM key_value_store WHERE key = ?", (key,), fetchone=True)
     return result[0] if result else None
 
 def add_voice_session(user_id, start_time, duration_seconds, game_name):
-    query("INSERT INTO voice_sessions (user_id, start_time, duration_seconds, game_name) VALUES (?, ?, ?, ?)", (user_id, start_time.isoformat(), duration_seconds, game_name), commit=True)
+    # Сессия целиком относится к дню начала (в МСК, как и utils.get_day_start_time), как и в выборке по start_time
+    with transaction():
+        query("INSERT INTO voice_sessions (user_id, start_time, duration_seconds, game_name) VALUES (?, ?, ?, ?)", (user_id, start_time.isoformat(), duration_seconds, game_name), commit=True)
+        query(
+            "INSERT INTO daily_user_stats (day, user_id, game_name, total_seconds, sessions) VALUES (?, ?, ?, ?, 1) "
+            "ON CONFLICT(day, user_id, game_name) DO UPDATE SET total_seconds = total_seconds + excluded.total_seconds, sessions = sessions + 1",
+            (start_time.date().isoformat(), user_id, game_name or '', duration_seconds), commit=True
+        )
 
 def get_daily_stats(day_start_time):
-    results, _ = query("SELECT u.id, u.name, SUM(vs.duration_seconds) FROM voice_sessions vs JOIN users u ON vs.user_id = u.id WHERE vs.start_time >= ? GROUP BY vs.user_id ORDER BY SUM(vs.duration_seconds) DESC", (day_start_time.isoformat(),))
+    results, _ = query("SELECT u.id, u.name, SUM(d.total_seconds) FROM daily_user_stats d JOIN users u ON d.user_id = u.id WHERE d.day = ? GROUP BY d.user_id ORDER BY SUM(d.total_seconds) DESC", (day_start_time.date().isoformat(),))
     return results
 
+def backfill_daily_user_stats():
+    """Пересобирает дневную сводку из истории voice_sessions. Возвращает число строк сводки.
+
+    Дни до границы компактизации не трогаются: их сессии уже свернуты в помесячные итоги.
+    """
+    compacted_before = get_key_value('sessions_compacted_before') or ''
+    with transaction() as conn:
+        conn.execute("DELETE FROM daily_user_stats WHERE day >= ?", (compacted_before[:10],))
+        return conn.execute(
+            "INSERT INTO daily_user_stats (day, user_id, game_name, total_seconds, sessions) "
+            "SELECT substr(start_time, 1, 10), user_id, COALESCE(game_name, ''), SUM(duration_seconds), COUNT(*) "
+            "FROM voice_sessions WHERE start_time >= ? GROUP BY 1, 2, 3", (compacted_before,)
+        ).rowcount
+
+# --- Компактизация истории ---
+
+def compact_voice_sessions_batch(cutoff, batch_size):
+    """Сворачивает до batch_size сессий, начатых раньше cutoff, в помесячные итоги одной транзакцией.
+
+    Возвращает (число свернутых сессий, их суммарная длительность).
+    """
+    batch = "SELECT id FROM voice_sessions WHERE start_time < ? ORDER BY id LIMIT ?"
+    params = (cutoff.isoformat(), batch_size)
+    with transaction() as conn:
+        folded, seconds = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(duration_seconds), 0) FROM voice_sessions WHERE id IN ({batch})", params).fetchone()
+        if not folded:
+            return 0, 0
+        conn.execute(
+            "INSERT INTO voice_sessions_monthly (month, user_id, game_name, total_seconds, sessions) "
+            f"SELECT substr(start_time, 1, 7), user_id, COALESCE(game_name, ''), SUM(duration_seconds), COUNT(*) FROM voice_sessions WHERE id IN ({batch}) GROUP BY 1, 2, 3 "
+            "ON CONFLICT(month, user_id, game_name) DO UPDATE SET total_seconds = total_seconds + excluded.total_seconds, sessions = sessions + excluded.sessions",
+            params
+        )
+        conn.execute(f"DELETE FROM voice_sessions WHERE id IN ({batch})", params)
+    return folded, seconds
+
+def get_database_pages():
+    """(размер страницы, всего страниц, свободных страниц)."""
+    with _write_lock:
+        conn = _get_writer()
+        return tuple(conn.execute(f"PRAGMA {name}").fetchone()[0] for name in ("page_size", "page_count", "freelist_count"))
+
+def is_incremental_vacuum():
+    with _write_lock:
+        return _get_writer().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+def enable_incremental_vacuum():
+    """Переводит БД в режим auto_vacuum=INCREMENTAL (однократный полный VACUUM). Возвращает True, если потребовалось.
+
+    Полный VACUUM держит блокировку записи все время перезаписи файла, поэтому вызывается
+    только из python manage.py compact, а не из фоновой компактизации.
+    """
+    with _write_lock:
+        conn = _get_writer()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+
+def incremental_vacuum(pages):
+    """Возвращает файловой системе до pages свободных страниц."""
+    with _write_lock:
+        _get_writer().execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+
 def get_telegram_id_by_discord_id(discord_id):
-    result, _ = query("SELECT telegram_id FROM users WHERE id = ?", (discord_id,), fetchone=True)
-    return result[0] if result and result[0] else None
+    return _telegram_by_discord.get(discord_id)
+
+def get_telegram_ids(discord_ids):
+    """Пакетный поиск Telegram ID: {discord_id: telegram_id} только для привязанных пользователей."""
+    return {uid: _telegram_by_discord[uid] for uid in discord_ids if uid in _telegram_by_discord}
 
 def link_steam_account(discord_id, steam_id):
-    query('INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)', (discord_id, f'user_{discord_id}'), commit=True)
-    query('UPDATE users SET steam_id = ? WHERE id = ?', (steam_id, discord_id), commit=True)
+    with transaction():
+        query('INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)', (discord_id, f'user_{discord_id}'), commit=True)
+        query('UPDATE users SET steam_id = ? WHERE id = ?', (steam_id, discord_id), commit=True)
+    if steam_id:
+        _steam_by_discord[discord_id] = steam_id
+    else:
+        _steam_by_discord.pop(discord_id, None)
 
 def get_steam_id(discord_id):
-    result, _ = query("SELECT steam_id FROM users WHERE id = ?", (discord_id,), fetchone=True)
-    return result[0] if result and result[0] else None
+    return _steam_by_discord.get(discord_id)
 
 def create_linking_code(code, discord_id):
     expires_at = datetime.utcnow() + timedelta(minutes=5)
@@ -139,30 +436,124 @@ def find_discord_id_by_code(code):
     return None
 
 def link_telegram_account(discord_id, telegram_id):
-    query('UPDATE users SET telegram_id = ? WHERE id = ?', (telegram_id, discord_id), commit=True)
+    """Привязывает Telegram к пользователю Discord; прежняя привязка этого Telegram к другому пользователю снимается."""
+    with transaction():
+        _, rowcount = query('UPDATE users SET telegram_id = ? WHERE id = ?', (telegram_id, discord_id), commit=True)
+        if rowcount == 0:
+            return
+        unlinked, _ = query('SELECT id FROM users WHERE telegram_id = ? AND id != ?', (telegram_id, discord_id))
+        query('UPDATE users SET telegram_id = NULL WHERE telegram_id = ? AND id != ?', (telegram_id, discord_id), commit=True)
+    for (other_id,) in unlinked:
+        _telegram_by_discord.pop(other_id, None)
+    previous = _telegram_by_discord.get(discord_id)
+    if previous and _discord_by_telegram.get(previous) == discord_id:
+        del _discord_by_telegram[previous]
+    _telegram_by_discord[discord_id] = telegram_id
+    _discord_by_telegram[telegram_id] = discord_id
 
 def get_discord_id_by_telegram_id(telegram_id):
-    result, _ = query("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,), fetchone=True)
-    return result[0] if result else None
+    return _discord_by_telegram.get(telegram_id)
 
 def delete_linking_code(code):
     query("DELETE FROM linking_codes WHERE code = ?", (code,), commit=True)
 
+def add_expiring_message(chat_id, message_id, base_text, parse_mode, expires_at):
+    query("INSERT OR REPLACE INTO expiring_messages (chat_id, message_id, base_text, parse_mode, expires_at) VALUES (?, ?, ?, ?, ?)",
+          (chat_id, message_id, base_text, parse_mode, expires_at), commit=True)
+
+def get_expiring_messages():
+    results, _ = query("SELECT chat_id, message_id, base_text, parse_mode, expires_at FROM expiring_messages")
+    return results
+
+def delete_expiring_messages(keys: list):
+    """keys: [(chat_id, message_id)]."""
+    with transaction() as conn:
+        conn.executemany("DELETE FROM expiring_messages WHERE chat_id = ? AND message_id = ?", keys)
+
 def update_stats(user_id, user_name, session_seconds, game_name):
-    query('INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)', (user_id, user_name), commit=True)
-    query('UPDATE users SET total_seconds = total_seconds + ?, name = ? WHERE id = ?', (session_seconds, user_name, user_id), commit=True)
-    if game_name and game_name != "Неизвестно":
-        query('INSERT OR IGNORE INTO games (name) VALUES (?)', (game_name,), commit=True)
-        query('UPDATE games SET total_seconds = total_seconds + ? WHERE name = ?', (session_seconds, game_name), commit=True)
+    with transaction():
+        query('INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)', (user_id, user_name), commit=True)
+        query('UPDATE users SET total_seconds = total_seconds + ?, name = ? WHERE id = ?', (session_seconds, user_name, user_id), commit=True)
+        _after_commit(lambda: leaderboard.users.add(user_id, session_seconds, user_name))
+        if game_name and game_name != "Неизвестно":
+            query('INSERT OR IGNORE INTO games (name) VALUES (?)', (game_name,), commit=True)
+            query('UPDATE games SET total_seconds = total_seconds + ? WHERE name = ?', (session_seconds, game_name), commit=True)
+            _after_commit(lambda: leaderboard.games.add(game_name, session_seconds, game_name))
+
+def close_voice_sessions(closes):
+    """Закрывает сессии одной транзакцией: активная сессия, запись в историю и общая статистика.
+
+    closes: список (user_id, user_name, end_time, game_name).
+    Возвращает список (join_time, duration) или None, если активной сессии не было.
+    """
+    results = []
+    with transaction():
+        for user_id, user_name, end_time, game_name in closes:
+            join_time = end_active_session(user_id)
+            if not join_time:
+                results.append(None)
+                continue
+            duration = (end_time - join_time).total_seconds()
+            add_voice_session(user_id, join_time, duration, game_name)
+            update_stats(user_id, user_name, duration, game_name)
+            results.append((join_time, duration))
+    return results
+
+def close_voice_session(user_id, user_name, end_time, game_name):
+    return close_voice_sessions([(user_id, user_name, end_time, game_name)])[0]
 
 def get_user_stats(user_id):
     result, _ = query("SELECT total_seconds, name FROM users WHERE id = ?", (user_id,), fetchone=True)
     return result
 
 def get_top_games(limit=5):
-    results, _ = query(f"SELECT name, total_seconds FROM games WHERE total_seconds > 0 ORDER BY total_seconds DESC LIMIT {limit}")
-    return results
+    return [(name, secs) for name, _, secs in leaderboard.games.top(limit)]
 
 def get_weekly_king():
-    result, _ = query("SELECT name FROM users ORDER BY total_seconds DESC LIMIT 1", fetchone=True)
-    return result
+    top = leaderboard.users.top(1, min_seconds=-1)
+    return (top[0][1],) if top else None
+
+# --- Таблицы лидеров в памяти ---
+
+def load_leaderboards():
+    users, _ = query("SELECT id, total_seconds, name FROM users")
+    games, _ = query("SELECT name, total_seconds, name FROM games")
+    leaderboard.users.load(users)
+    leaderboard.games.load(games)
+
+def verify_leaderboards():
+    """Сверяет таблицы лидеров в памяти с users и games. Возвращает список расхождений (пустой, если все сходится)."""
+    mismatches = []
+    for board, sql in ((leaderboard.users, "SELECT id, total_seconds FROM users"), (leaderboard.games, "SELECT name, total_seconds FROM games")):
+        rows, _ = query(sql)
+        expected = {key: seconds or 0 for key, seconds in rows}
+        actual = board.snapshot()
+        for key in expected.keys() | actual.keys():
+            if abs(expected.get(key, 0) - actual.get(key, 0)) > 1e-6:
+                mismatches.append((key, expected.get(key), actual.get(key)))
+    return mismatches
+
+# --- Прогресс ачивок в памяти ---
+
+def load_achievements():
+    counters, _ = query("SELECT id, 'total', total_seconds FROM users WHERE total_seconds > 0")
+    games = achievements.engine.tracked_games()
+    if games:
+        rows, _ = query(f"SELECT user_id, game_name, SUM(total_seconds) FROM daily_user_stats WHERE game_name IN ({','.join('?' * len(games))}) GROUP BY user_id, game_name", games)
+        counters += [(user_id, ("game", game), seconds) for user_id, game, seconds in rows]
+    days, _ = query("SELECT DISTINCT user_id, day FROM daily_user_stats ORDER BY day")
+    earned, _ = query("SELECT user_id, achievement FROM achievements")
+    achievements.engine.load(counters, days, earned)
+
+def backfill_achievements():
+    """Одной транзакцией выдает все ачивки, на которые пользователи уже наработали. Возвращает список (user_id, название)."""
+    grants = achievements.engine.pending()
+
+    def mark_earned():
+        for user_id, name in grants:
+            achievements.engine.mark_earned(user_id, name)
+
+    with transaction() as conn:
+        conn.executemany("INSERT OR IGNORE INTO achievements (user_id, achievement) VALUES (?, ?)", grants)
+        _after_commit(mark_earned)
+    return grants
@@ -0,0 +1,59 @@
+# debounce.py
+"""Отложенный вызов с группировкой событий.
+
+Каждое событие сдвигает вызов на delay секунд (trailing debounce), но не дальше чем
+на max_wait от первого события пачки, поэтому при непрерывном потоке событий
+сообщение все равно обновляется. Аргументы событий пачки объединяются:
+force_creation - по ИЛИ, mode и text_override - последние явно переданные.
+"""
+import asyncio
+
+class Debouncer:
+    def __init__(self, callback, delay, max_wait):
+        self.callback, self.delay, self.max_wait = callback, delay, max_wait
+        self._pending = None
+        self._batch = 0
+        self._first = self._deadline = 0.0
+        self._task = None
+        self.stats = {"events": 0, "renders": 0, "max_batch": 0, "max_wait_hits": 0}
+
+    def trigger(self, text_override=None, mode=None, force_creation=False):
+        now = asyncio.get_running_loop().time()
+        self.stats["events"] += 1
+        if self._pending is None:
+            self._pending = {"text_override": None, "mode": "main", "force_creation": False}
+            self._batch, self._first = 0, now
+        self._batch += 1
+        if text_override is not None: self._pending["text_override"] = text_override
+        if mode is not None: self._pending["mode"] = mode
+        self._pending["force_creation"] |= force_creation
+        self._deadline = min(now + self.delay, self._first + self.max_wait)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._pending is not None:
+            remaining = self._deadline - loop.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)  # срок мог сдвинуться, пока спали - проверяем снова
+                continue
+            kwargs, batch = self._pending, self._batch
+            if self._deadline >= self._first + self.max_wait:
+                self.stats["max_wait_hits"] += 1
+            self._pending = None
+            self.stats["renders"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], batch)
+            try:
+                await self.callback(**kwargs)
+            except Exception as e:
+                print(f"ERROR: Отложенное обновление не удалось: {e}")
+
+    @property
+    def idle(self):
+        return self._task is None or self._task.done()
+
+    def cancel(self):
+        self._pending = None
+        if self._task and not self._task.done():
+            self._task.cancel()
@@ -4,14 +4,20 @@ import os
 import discord
 from discord import app_commands
 import asyncio
-from datetime import datetime, timedelta
-from collections import defaultdict
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.constants import ParseMode
-from telegram.error import BadRequest
+from datetime import datetime
+from telegram import Bot
 import random
 import string
-import database
+import time
+import achievements
+import async_database as db
+import health
+from guild_monitor import GuildMonitor
+import journal
+import log_setup
+import metrics
+from telegram_edits import EditScheduler
+import steam_presence
 import utils
 import config
 
@@ -19,6 +25,9 @@ import config
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+# Свой чат для каждого сервера: "guild_id:chat_id,guild_id:chat_id". Остальные серверы идут в TELEGRAM_CHAT_ID.
+GUILD_CHAT_IDS = {int(guild_id): chat_id for guild_id, chat_id in
+                  (pair.split(':', 1) for pair in os.getenv('TELEGRAM_CHAT_MAP', '').split(',') if pair)}
 
 intents = discord.Intents.default()
 intents.voice_states = True
@@ -29,13 +38,21 @@ client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 
 telegram_bot = Bot(token=TELEGRAM_TOKEN)
+edit_scheduler = EditScheduler(telegram_bot)
 
 # --- Состояние бота ---
-voice_users, telegram_message_info = {}, {"message_id": None}
-active_channel_link, last_voice_session_end_time = None, None
-coming_soon_users = {}
-update_task = None # ИЗМЕНЕНИЕ: Задача для отложенного обновления
-update_lock = asyncio.Lock() # ИЗМЕНЕНИЕ: Блокировка для предотвращения гонки состояний
+monitors = {}  # guild_id -> GuildMonitor
+steam_poller_task = None
+periodic_updater_task = None
+presence_stats = {"received": 0, "dropped": 0, "throttled": 0, "acted": 0}
+_presence_last_acted = {}  # (guild_id, user_id) -> время последнего обработанного события
+_presence_deferred = {}  # (guild_id, user_id) -> последний снимок участника, ждущий конца окна
+
+metrics.add_collector("nexus_telegram_edits", edit_scheduler.stats)
+metrics.add_collector("nexus_presence_events", presence_stats)
+metrics.add_collector("nexus_status_updates", lambda: {
+    key: sum(m.debouncer.stats[key] for m in monitors.values()) for key in ('events', 'renders', 'max_wait_hits')})
+metrics.add_collector("nexus_voice", lambda: {"users": sum(len(m.voice_users) for m in monitors.values()), "guilds": len(monitors)})
 
 # --- Команды и утилиты ---
 
@@ -44,8 +61,8 @@ update_lock = asyncio.Lock() # ИЗМЕНЕНИЕ: Блокировка для 
 async def link_command(interaction: discord.Interaction, steam_id: str):
     code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
     code_formatted = f"{code[:3]}-{code[3:]}"
-    database.link_steam_account(interaction.user.id, steam_id)
-    database.create_linking_code(code_formatted, interaction.user.id)
+    await db.link_steam_account(interaction.user.id, steam_id)
+    await db.create_linking_code(code_formatted, interaction.user.id)
     try:
         await interaction.user.send(
             f"👋 Привет! Ваш Steam-аккаунт `{steam_id}` успешно привязан.\n\n"
@@ -56,260 +73,252 @@ async def link_command(interaction: discord.Interaction, steam_id: str):
     except discord.Forbidden:
         await interaction.response.send_message("❌ Не могу отправить ЛС. Разрешите прием сообщений в настройках приватности.", ephemeral=True)
 
-def add_coming_soon_user(user_id, user_name):
-    if user_id in voice_users: return
-    print(f"INFO: Пользователь {user_name} ({user_id}) добавлен в список 'Скоро зайду'.")
-    expiration_time = datetime.now(utils.MOSCOW_TZ) + timedelta(minutes=30)
-    coming_soon_users[user_id] = {"name": user_name, "expires_at": expiration_time}
-
-async def repost_message():
-    global telegram_message_info
-    if telegram_message_info.get("message_id"):
-        try: await telegram_bot.delete_message(TELEGRAM_CHAT_ID, telegram_message_info["message_id"])
-        except BadRequest: pass
-    telegram_message_info["message_id"] = None
-    await schedule_update(force_creation=True)
-
-async def format_telegram_message():
-    global coming_soon_users
-    now = datetime.now(utils.MOSCOW_TZ)
-
-    if voice_users:
-        lines = ["🟢 **Онлайн:**"]
-    else:
-        lines = ["🔴 **Офлайн**"]
-
-    for uid, data in sorted(voice_users.items(), key=lambda i: i[1]['join_time']):
-        coming_soon_users.pop(uid, None)
-        tg_id = database.get_telegram_id_by_discord_id(uid)
-        link = f"[{utils.escape_markdown(data['name'])}](tg://user?id={tg_id})" if tg_id else utils.escape_markdown(data['name'])
-        dur = utils.format_duration((now - data['join_time']).total_seconds())
-        stat = "".join([" 🎥" if data.get('video') else "", " 🔴" if data.get('streaming') else ""])
-        game = data.get('game', 'Неизвестно')
-        game_url = utils.get_steam_app_url(game)
-        game_str = f" (играет в [{utils.escape_markdown(game)}]({game_url}))" if game_url else (f" (играет в *{utils.escape_markdown(game)}*)" if game != "Неизвестно" else "")
-        lines.append(f"• {link}{stat} - {dur}{game_str}")
-    
-    if voice_users:
-        lines.append("")
-
-    expired_users = [uid for uid, data in coming_soon_users.items() if now > data['expires_at']]
-    for uid in expired_users:
-        print(f"INFO: Пользователь {coming_soon_users[uid]['name']} удален из 'Скоро зайду' по тайм-ауту.")
-        del coming_soon_users[uid]
-        
-    today_stats = database.get_daily_stats(utils.get_day_start_time())
-    users_in_voice_ids = set(voice_users.keys())
-    filtered_today_stats = [s for s in today_stats if s[0] not in users_in_voice_ids]
-
-    # ИЗМЕНЕНИЕ: Добавляем пустую строку после "Офлайн" для красоты
-    if not voice_users and (coming_soon_users or filtered_today_stats):
-        lines.append("")
-
-    if coming_soon_users:
-        lines.append("🚶‍♂️ **Скоро зайдет:**")
-        for uid, data in coming_soon_users.items():
-            tg_id = database.get_telegram_id_by_discord_id(uid)
-            link = f"[{utils.escape_markdown(data['name'])}](tg://user?id={tg_id})" if tg_id else utils.escape_markdown(data['name'])
-            lines.append(f"• {link}")
-        lines.append("")
-
-    if filtered_today_stats:
-        lines.append("🗓 **Были сегодня:**")
-        for uid, name, secs in filtered_today_stats:
-            tg_id = database.get_telegram_id_by_discord_id(uid)
-            link = f"[{utils.escape_markdown(name)}](tg://user?id={tg_id})" if tg_id else utils.escape_markdown(name)
-            lines.append(f"• {link} - {utils.format_duration(secs)}")
-
-    return "\n".join(lines).strip()
-
-# --- Логика отправки и обновления сообщений ---
-
-async def _update_message_task(text_override=None, mode="main", force_creation=False):
-    """Задача, которая непосредственно выполняет обновление после задержки."""
-    await asyncio.sleep(2)  # Задержка в 2 секунды для группировки событий
-    async with update_lock:
-        print("INFO: Запускаю отложенное обновление...")
-        await send_or_edit_message(text_override, mode, force_creation)
-
-async def schedule_update(text_override=None, mode="main", force_creation=False):
-    """Планирует отложенное обновление, отменяя предыдущее."""
-    global update_task
-    if update_task and not update_task.done():
-        update_task.cancel()
-    update_task = asyncio.create_task(_update_message_task(text_override, mode, force_creation))
-
-
-async def send_or_edit_message(text_override=None, mode="main", force_creation=False):
-    global telegram_message_info
-    database.set_key_value('voice_users_count', len(voice_users))
-    is_new_message_needed = not telegram_message_info.get("message_id")
-    
-    if is_new_message_needed and utils.is_quiet_hours() and not force_creation and not text_override and mode == "main":
-        print("INFO: Тихие часы. Создание нового сообщения подавлено.")
-        return
+def get_monitor(guild):
+    """Монитор сервера; создается при первом обращении. None, если серверу не назначен чат."""
+    monitor = monitors.get(guild.id)
+    if monitor is None:
+        chat_id = GUILD_CHAT_IDS.get(guild.id, TELEGRAM_CHAT_ID)
+        if not chat_id: return None
+        guild_id = guild.id
+        def is_member(uid):
+            current = client.get_guild(guild_id)
+            return current is not None and current.get_member(uid) is not None
+        monitor = monitors[guild.id] = GuildMonitor(guild.id, chat_id, telegram_bot, edit_scheduler, is_member)
+        print(f"INFO: Сервер {guild.name} ({guild.id}) транслируется в чат {chat_id}.")
+    return monitor
+
+def get_monitors_for_chat(chat_id):
+    """Мониторы, публикующие статус в чат Telegram (для кнопок и /up)."""
+    found = [m for m in monitors.values() if str(m.chat_id) == str(chat_id)]
+    if not found and len(monitors) == 1:
+        found = list(monitors.values())  # чат задан через @username
+    return found
+
+def get_monitor_for_chat(chat_id, message_id=None):
+    """Монитор, которому принадлежит сообщение с кнопкой (если в чат транслируется несколько серверов)."""
+    found = get_monitors_for_chat(chat_id)
+    return next((m for m in found if m.message_id == message_id), found[0] if found else None)
+
+def record_voice_users_count():
+    health.set_value('voice_users_count', sum(len(m.voice_users) for m in monitors.values()))
+
+async def check_achievements(monitor, uid, name, join_time, duration, game_name):
+    # Прогресс считается в памяти, БД затрагивается только при пройденном пороге
+    for achievement_name in achievements.engine.record(uid, join_time.date(), game_name, duration):
+        # Ачивка отмечается выданной только после записи; False - она уже была в БД
+        granted = await db.grant_achievement(uid, achievement_name)
+        achievements.engine.mark_earned(uid, achievement_name)
+        if granted:
+            print(f"INFO: Выдана новая ачивка '{achievement_name}' пользователю {name}")
+            await monitor.announce(f"🎉 **Новое достижение!**\nПользователь **{utils.escape_markdown(name)}** открыл ачивку: **{achievement_name}**")
 
-    keyboard = []
-    if mode == "main":
-        if voice_users:
-            keyboard.append([InlineKeyboardButton("🚶‍♂️ Скоро зайду", callback_data='coming_soon')])
-    elif mode == "daily_stats":
-        keyboard.append([InlineKeyboardButton("⬅️ Назад к мониторингу", callback_data='back_to_main')])
+def playing_activity(member):
+    return next((a.name for a in member.activities if a.type == discord.ActivityType.playing), "Неизвестно")
 
-    text = text_override or await format_telegram_message()
-    markup = InlineKeyboardMarkup(keyboard) if keyboard else None
-    
-    try:
-        if not telegram_message_info.get("message_id"):
-            msg = await telegram_bot.send_message(TELEGRAM_CHAT_ID, text, ParseMode.MARKDOWN, reply_markup=markup, disable_notification=True, disable_web_page_preview=True)
-            telegram_message_info["message_id"] = msg.message_id
-            print(f"INFO: Создано новое сообщение (ID: {msg.message_id})")
-        else:
-            await telegram_bot.edit_message_text(text, TELEGRAM_CHAT_ID, telegram_message_info["message_id"], parse_mode=ParseMode.MARKDOWN, reply_markup=markup, disable_web_page_preview=True)
-            print(f"INFO: Сообщение (ID: {telegram_message_info['message_id']}) отредактировано.")
-        database.set_key_value('last_telegram_success', datetime.now(utils.MOSCOW_TZ).isoformat())
-
-    except BadRequest as e:
-        error_text = str(e).lower()
-        if "message to edit not found" in error_text:
-            print("INFO: Сообщение было удалено вручную. Пересоздаю...")
-            telegram_message_info["message_id"] = None
-            await send_or_edit_message(text, mode=mode, force_creation=True) # Прямой вызов без планировщика
-        elif "message is not modified" not in error_text:
-            print(f"ERROR: Неожиданная ошибка BadRequest: {e}")
-            telegram_message_info["message_id"] = None
-            
-    except Exception as e:
-        print(f"КРИТИЧЕСКАЯ ОШИБКА отправки: {e}")
-        telegram_message_info["message_id"] = None
-
-async def check_achievements(uid, name):
-    stats = database.get_user_stats(uid)
-    if not stats: return
-    for required_seconds, achievement_name in config.ACHIEVEMENTS.items():
-        if stats[0] >= required_seconds and database.grant_achievement(uid, achievement_name):
-            print(f"INFO: Выдана новая ачивка '{achievement_name}' пользователю {name}")
-            await telegram_bot.send_message(
-                TELEGRAM_CHAT_ID,
-                f"🎉 **Новое достижение!**\nПользователь **{utils.escape_markdown(name)}** открыл ачивку: **{achievement_name}**",
-                parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True
-            )
-            database.set_key_value('last_telegram_success', datetime.now(utils.MOSCOW_TZ).isoformat())
-
-async def update_user_status(member) -> bool:
+async def update_user_status(monitor, member) -> bool:
+    voice_users = monitor.voice_users
     if member.id not in voice_users: return False
     old_status = {k: voice_users[member.id].get(k) for k in ('game', 'streaming', 'video')}
-    steam_id = database.get_steam_id(member.id)
-    game = next((a.name for a in member.activities if a.type == discord.ActivityType.playing), "Неизвестно")
-    steam_game = utils.get_game_from_steam(steam_id)
-    if steam_game:
-        database.set_key_value('last_steam_success', datetime.now(utils.MOSCOW_TZ).isoformat())
+    game = playing_activity(member)
+    steam_game = steam_presence.get_current_game(db.get_steam_id(member.id))
     new_status = {
-        'name': member.display_name, 'game': steam_game or game,
+        'name': member.display_name, 'game': steam_game or game, 'activity_game': game,
         'streaming': member.voice.self_stream if member.voice else False,
         'video': member.voice.self_video if member.voice else False
     }
     voice_users[member.id].update(new_status)
-    return any(old_status[key] != new_status.get(key) for key in old_status)
+    changed = any(old_status[key] != new_status.get(key) for key in old_status)
+    if changed:
+        monitor.renderer.invalidate(member.id)
+    return changed
+
+def get_voice_steam_ids():
+    return {steam_id for m in monitors.values() for uid in m.voice_users if (steam_id := db.get_steam_id(uid))}
+
+async def on_steam_poll(changed_steam_ids):
+    """Применяет результаты фонового опроса Steam к пользователям в войсе всех серверов."""
+    health.beat('last_steam_success')
+    for monitor in monitors.values():
+        changed = False
+        for uid, data in monitor.voice_users.items():
+            steam_id = db.get_steam_id(uid)
+            if steam_id in changed_steam_ids:
+                game = steam_presence.get_current_game(steam_id) or data.get('activity_game', "Неизвестно")
+                if data.get('game') != game:
+                    data['game'] = game
+                    changed = True
+        if changed:
+            await monitor.schedule_update()
+
+def channel_link(guild_id, channel_id):
+    return f"https://discord.com/channels/{guild_id}/{channel_id}"
 
 # --- Обработчики событий Discord ---
 
 @client.event
+@metrics.timed_handler("ready")
 async def on_ready():
-    global active_channel_link, last_voice_session_end_time, voice_users
+    global steam_poller_task, periodic_updater_task
     await tree.sync()
     client.loop.create_task(utils.fetch_steam_app_list_to_db())
+    if steam_poller_task is None or steam_poller_task.done():
+        steam_poller_task = client.loop.create_task(steam_presence.run(get_voice_steam_ids, on_steam_poll))
     print("--- [RE]CONNECT: Восстановление состояния из БД... ---")
-    database.set_key_value('last_discord_success', datetime.now(utils.MOSCOW_TZ).isoformat())
-    voice_users.clear()
-    stored_sessions = database.get_all_active_sessions()
-    all_voice_members = {m.id: m for g in client.guilds for m in g.members if m.voice}
-    for user_id, join_time in stored_sessions:
-        if user_id in all_voice_members:
-            member = all_voice_members[user_id]
-            voice_users[user_id] = {"name": member.display_name, "join_time": join_time}
-            await update_user_status(member)
-        else:
-            print(f"INFO: Пользователь {user_id} вышел, пока бот был оффлайн.")
-            ended_session_join_time = database.end_active_session(user_id)
-            if ended_session_join_time:
-                duration = (datetime.now(utils.MOSCOW_TZ) - ended_session_join_time).total_seconds()
-                database.add_voice_session(user_id, ended_session_join_time, duration, 'Неизвестно')
+    health.beat('last_discord_success')
+    await restore_voice_state(client.guilds)
+    steam_presence.request_refresh()
+    if periodic_updater_task is None or periodic_updater_task.done():
+        periodic_updater_task = client.loop.create_task(periodic_updater())
+
+async def restore_voice_state(guilds):
+    """Сверяет активные сессии в БД с теми, кто сейчас в войсе, и пересоздает статусные сообщения.
+
+    Обходит только участников голосовых каналов (а не всех участников серверов), а сессии
+    сверяет одной транзакцией, чтобы после переподключения статус обновился как можно быстрее.
+    Сверяются все видимые серверы (иначе сессии тех, кто в войсе на сервере без чата, закрывались бы
+    как вышедшие), а статусы заполняются только для серверов с монитором.
+    """
+    started = time.perf_counter()
+    for monitor in monitors.values():
+        monitor.voice_users.clear()
+    connected = {m.id: m for g in guilds for channel in g.voice_channels + g.stage_channels for m in channel.members if not m.bot}
+    all_voice_members = {uid: m for uid, m in connected.items() if get_monitor(m.guild)}
+    journal.record("ready", m=[[m.guild.id, m.id, m.display_name, m.voice.channel.id, bool(m.voice.self_stream), bool(m.voice.self_video), playing_activity(m)]
+                               for m in all_voice_members.values()])
+    now = datetime.now(utils.MOSCOW_TZ)
+    sessions, closed = await db.reconcile_active_sessions(all_voice_members.keys(), now, connected.keys())
+    for user_id in closed:
+        print(f"INFO: Пользователь {user_id} вышел, пока бот был оффлайн.")
+    if closed:
+        for monitor in monitors.values():
+            monitor.renderer.invalidate_today()
+    # Игра из Steam и привязки берутся из памяти, поэтому статусы заполняются без обращений к БД и сети
     for member_id, member in all_voice_members.items():
-        if member_id not in voice_users:
+        monitor = monitors[member.guild.id]
+        if sessions[member_id] == now:
             print(f"INFO: Пользователь {member.display_name} зашел, пока бот был оффлайн.")
-            now = datetime.now(utils.MOSCOW_TZ)
-            voice_users[member_id] = {"name": member.display_name, "join_time": now}
-            database.start_active_session(member_id, now)
-            await update_user_status(member)
-    
-    active_channel_link = None
-    if voice_users:
-        first_user_id = next(iter(voice_users))
-        if all_voice_members.get(first_user_id) and all_voice_members[first_user_id].voice:
-            active_channel_link = f"https://discord.com/channels/{all_voice_members[first_user_id].guild.id}/{all_voice_members[first_user_id].voice.channel.id}"
-
-    print(f"✅ Состояние восстановлено. В войсе: {len(voice_users)} пользователей.")
-    await schedule_update(force_creation=True)
-    client.loop.create_task(periodic_updater())
+        monitor.voice_users[member_id] = {"name": member.display_name, "join_time": sessions[member_id]}
+        await update_user_status(monitor, member)
+    elapsed = time.perf_counter() - started
+    metrics.observe("nexus_restore_seconds", elapsed)
+    print(f"INFO: Сессии сверены за {elapsed * 1000:.0f} мс: в войсе {len(all_voice_members)}, закрыто {len(closed)}.")
+
+    for monitor in monitors.values():
+        monitor.active_channel_link = None
+        if monitor.voice_users:
+            first_member = all_voice_members.get(next(iter(monitor.voice_users)))
+            if first_member and first_member.voice:
+                monitor.active_channel_link = channel_link(monitor.guild_id, first_member.voice.channel.id)
+        print(f"✅ Состояние восстановлено [{monitor.guild_id}]. В войсе: {len(monitor.voice_users)} пользователей.")
+        await monitor.schedule_update(force_creation=True)
+    record_voice_users_count()
 
 @client.event
+@metrics.timed_handler("voice_state_update")
 async def on_voice_state_update(member, before, after):
-    global active_channel_link, last_voice_session_end_time
-    database.set_key_value('last_discord_success', datetime.now(utils.MOSCOW_TZ).isoformat())
+    health.beat('last_discord_success')
     if member.bot: return
+    journal.record("voice", g=member.guild.id, u=member.id, n=member.display_name,
+                   b=before.channel.id if before.channel else None, a=after.channel.id if after.channel else None,
+                   s=bool(after.self_stream), v=bool(after.self_video), p=playing_activity(member))
+    monitor = get_monitor(member.guild)
+    if monitor is None: return
+    voice_users = monitor.voice_users
     now = datetime.now(utils.MOSCOW_TZ)
     changed = False
 
     if not before.channel and after.channel:
         print(f"EVENT: {member.display_name} зашел в канал.")
-        database.start_active_session(member.id, now)
+        await db.start_active_session(member.id, now)
         voice_users[member.id] = {"name": member.display_name, "join_time": now}
-        await update_user_status(member)
+        await update_user_status(monitor, member)
+        if db.get_steam_id(member.id):
+            steam_presence.request_refresh()
         if len(voice_users) == 1:
-            active_channel_link = f"https://discord.com/channels/{member.guild.id}/{after.channel.id}"
+            monitor.active_channel_link = channel_link(member.guild.id, after.channel.id)
         changed = True
 
     elif before.channel and not after.channel:
         print(f"EVENT: {member.display_name} вышел из канала.")
-        join_time = database.end_active_session(member.id)
-        if join_time:
-            duration = (now - join_time).total_seconds()
-            game_name = voice_users.get(member.id, {}).get('game', "Неизвестно")
-            database.add_voice_session(member.id, join_time, duration, game_name)
-            database.update_stats(member.id, member.display_name, duration, game_name)
-            await check_achievements(member.id, member.display_name)
+        game_name = voice_users.get(member.id, {}).get('game', "Неизвестно")
+        closed = await db.close_voice_session(member.id, member.display_name, now, game_name)
+        if closed:
+            for m in monitors.values():
+                m.renderer.invalidate_today()
+            await check_achievements(monitor, member.id, member.display_name, *closed, game_name)
         voice_users.pop(member.id, None)
+        _presence_last_acted.pop((monitor.guild_id, member.id), None)
+        monitor.renderer.invalidate(member.id)
         if not voice_users:
-            last_voice_session_end_time = now
-            active_channel_link = None
+            monitor.last_voice_session_end_time = now
+            monitor.active_channel_link = None
         changed = True
 
     elif before.channel and after.channel and before.channel != after.channel:
         if len(voice_users) == 1:
-            active_channel_link = f"https://discord.com/channels/{member.guild.id}/{after.channel.id}"
+            monitor.active_channel_link = channel_link(member.guild.id, after.channel.id)
         changed = True # Канал изменился, нужно обновить ссылку
 
+    elif before.channel and after.channel:
+        # Тот же канал: стрим или камера (смену микрофона и звука update_user_status не заметит)
+        changed = await update_user_status(monitor, member)
+
     if changed:
-        await schedule_update()
+        record_voice_users_count()
+        await monitor.schedule_update()
 
 @client.event
+@metrics.timed_handler("presence_update")
 async def on_presence_update(before, after):
-    if after.id in voice_users and await update_user_status(after):
-        await schedule_update()
+    presence_stats["received"] += 1
+    monitor = monitors.get(after.guild.id)
+    data = monitor.voice_users.get(after.id) if monitor else None
+    key = (monitor.guild_id, after.id) if data is not None else None
+    if data is not None:
+        journal.record("presence", g=after.guild.id, u=after.id, n=after.display_name, p=playing_activity(after))
+    if key in _presence_deferred:
+        # Уже ждет конца окна: запоминаем самый свежий снимок (в том числе возврат к прежней игре)
+        presence_stats["throttled"] += 1
+        _presence_deferred[key] = after
+        return
+    # Быстрый путь: нас интересуют только игра и имя пользователей в войсе
+    if data is None or (playing_activity(after) == data.get('activity_game') and after.display_name == data.get('name')):
+        presence_stats["dropped"] += 1
+        return
+    wait = _presence_last_acted.get(key, float('-inf')) + config.PRESENCE_THROTTLE_SECONDS - asyncio.get_running_loop().time()
+    if wait > 0:
+        # Частые переключения: применим только последнее состояние по окончании окна
+        presence_stats["throttled"] += 1
+        _presence_deferred[key] = after
+        asyncio.create_task(_apply_deferred_presence(monitor, key, wait))
+        return
+    await _apply_presence(monitor, key, after)
+
+async def _apply_presence(monitor, key, member):
+    _presence_last_acted[key] = asyncio.get_running_loop().time()
+    presence_stats["acted"] += 1
+    if await update_user_status(monitor, member):
+        await monitor.schedule_update()
+
+async def _apply_deferred_presence(monitor, key, wait):
+    await asyncio.sleep(wait)
+    member = _presence_deferred.pop(key, None)
+    if member and member.id in monitor.voice_users:
+        await _apply_presence(monitor, key, member)
 
 async def periodic_updater():
-    """Периодически обновляет сообщение, чтобы актуализировать время."""
+    """Периодически обновляет сообщения, чтобы актуализировать время."""
     while True:
         await asyncio.sleep(60)
-        # Обновляем только если есть кто-то в войсе, чтобы таймеры двигались
-        if voice_users:
-            print("INFO: Плановое обновление таймеров...")
-            await schedule_update()
+        # Обновляем только серверы, где кто-то есть в войсе, чтобы таймеры двигались
+        for monitor in monitors.values():
+            if monitor.voice_users:
+                log_setup.print_sampled(("timers", monitor.guild_id), f"INFO: [{monitor.guild_id}] Плановое обновление таймеров...")
+                await monitor.schedule_update()
 
 async def run():
     print("--- Запуск Discord бота... ---")
-    database.set_key_value('start_time', datetime.now(utils.MOSCOW_TZ).isoformat())
+    health.beat('start_time')
     try:
         await client.start(DISCORD_TOKEN)
     finally:
@@ -0,0 +1,106 @@
+# expiry.py
+"""Исчезающие ответы бота: одна фоновая задача вместо трех заданий job_queue на каждый ответ.
+
+Сообщения хранятся в таблице expiring_messages, поэтому после перезапуска недоудаленные
+ответы подхватываются и удаляются. Отсчет ("исчезнет через N секунд") обновляется
+только если в лимите чата есть свободный запрос, а если задача опоздала сразу на
+несколько отметок, показывается только последняя. Удаления одного чата идут одним
+запросом deleteMessages.
+"""
+import asyncio
+import time
+
+from telegram.error import BadRequest
+
+import async_database as db
+import config
+
+def countdown_footer(seconds):
+    return f"\n\n*🗑️ Сообщение исчезнет через {seconds} секунд...*"
+
+class ExpiryWheel:
+    def __init__(self, edit_scheduler):
+        self.edit_scheduler = edit_scheduler
+        self._entries = {}  # (chat_id, message_id) -> {"text", "parse_mode", "expires_at", "shown"}
+        self._wakeup = asyncio.Event()
+        self.stats = {"tracked": 0, "countdown_edits": 0, "countdown_skipped": 0, "deleted": 0, "delete_requests": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def load(self):
+        """Подхватывает сообщения, оставшиеся от прошлого запуска."""
+        for chat_id, message_id, text, parse_mode, expires_at in await db.get_expiring_messages():
+            self._entries[(chat_id, message_id)] = {"text": text, "parse_mode": parse_mode, "expires_at": expires_at, "shown": None}
+        if self._entries:
+            print(f"INFO: Восстановлено исчезающих сообщений: {len(self._entries)}.")
+
+    async def send(self, chat_id, text, parse_mode=None, ttl=None):
+        """Отправляет ответ с отсчетом и ставит его на удаление через ttl секунд."""
+        ttl = config.EPHEMERAL_MESSAGE_TTL_SECONDS if ttl is None else ttl
+        message = await self.edit_scheduler.send(chat_id, text + countdown_footer(ttl), parse_mode=parse_mode, disable_web_page_preview=True)
+        expires_at = time.time() + ttl
+        await db.add_expiring_message(chat_id, message.message_id, text, parse_mode, expires_at)
+        self._entries[(chat_id, message.message_id)] = {"text": text, "parse_mode": parse_mode, "expires_at": expires_at, "shown": ttl}
+        self.stats["tracked"] += 1
+        self._wakeup.set()
+        return message
+
+    def _due_mark(self, entry, remaining):
+        """Наименьшая отметка отсчета, до которой уже дошли, но которая еще не показана."""
+        marks = [m for m in config.EPHEMERAL_COUNTDOWN_MARKS if remaining <= m and (entry["shown"] is None or m < entry["shown"])]
+        return min(marks) if marks else None
+
+    async def _tick(self):
+        now = time.time()
+        expired, countdowns, next_due = {}, [], float("inf")
+        for key, entry in self._entries.items():
+            remaining = entry["expires_at"] - now
+            if remaining <= 0:
+                expired.setdefault(key[0], []).append(key[1])
+                continue
+            mark = self._due_mark(entry, remaining)
+            if mark is not None:
+                countdowns.append((key, entry, mark))
+            next_due = min(next_due, entry["expires_at"],
+                           *(entry["expires_at"] - m for m in config.EPHEMERAL_COUNTDOWN_MARKS if entry["expires_at"] - m > now))
+
+        for chat_id, message_ids in expired.items():
+            try:
+                await self.edit_scheduler.delete(chat_id, message_ids)
+                self.stats["delete_requests"] += 1
+            except BadRequest as e:
+                print(f"INFO: Не удалось удалить сообщения в чате {chat_id}: {e}")
+            self.stats["deleted"] += len(message_ids)
+            keys = [(chat_id, message_id) for message_id in message_ids]
+            for key in keys:
+                del self._entries[key]
+            await db.delete_expiring_messages(keys)
+
+        for (chat_id, message_id), entry, mark in countdowns:
+            entry["shown"] = mark
+            if entry["expires_at"] - time.time() < 1 or not self.edit_scheduler.has_capacity(chat_id):
+                self.stats["countdown_skipped"] += 1  # лимит чата нужнее статусному сообщению
+                continue
+            try:
+                await self.edit_scheduler.edit(chat_id, message_id, entry["text"] + countdown_footer(mark),
+                                               parse_mode=entry["parse_mode"], disable_web_page_preview=True)
+                self.stats["countdown_edits"] += 1
+            except BadRequest:
+                self.stats["countdown_skipped"] += 1
+        return next_due
+
+    async def run(self):
+        """Фоновая задача; load() вызывается до нее, чтобы не пропустить оставшиеся сообщения."""
+        while True:
+            self._wakeup.clear()
+            try:
+                next_due = await self._tick()
+            except Exception as e:
+                print(f"ERROR: Обработка исчезающих сообщений: {e}")
+                next_due = time.time() + 5
+            timeout = None if next_due == float("inf") else max(0.0, next_due - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,96 @@
+# fakes.py
+"""Минимальные заменители объектов discord.py и telegram для воспроизведения журнала и бенчмарков.
+
+Содержат только те поля и методы, которыми пользуются discord_bot и guild_monitor.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import discord
+
+class FakeGuild:
+    def __init__(self, guild_id, name="Бенчмарк"):
+        self.id, self.name = guild_id, name
+        self._members = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    @property
+    def voice_channels(self):
+        """Только занятые каналы: в отличие от discord.py, пустые не нужны."""
+        channels = {}
+        for member in self._members.values():
+            if member.voice and member.voice.channel:
+                channels.setdefault(member.voice.channel.id, SimpleNamespace(id=member.voice.channel.id, members=[]))
+                channels[member.voice.channel.id].members.append(member)
+        return list(channels.values())
+
+    @property
+    def stage_channels(self):
+        return []
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+class FakeVoiceState:
+    def __init__(self, channel=None, self_stream=False, self_video=False):
+        self.channel, self.self_stream, self.self_video = channel, self_stream, self_video
+
+class FakeMember:
+    def __init__(self, user_id, guild, name=None):
+        self.id, self.guild = user_id, guild
+        self.display_name = name or f"Игрок_{user_id}"
+        self.bot = False
+        self.activities = []
+        self.voice = None
+        guild._members[user_id] = self
+
+    def play(self, game):
+        """Меняет текущую игру (None - не играет) и возвращает участника для on_presence_update."""
+        self.activities = [SimpleNamespace(type=discord.ActivityType.playing, name=game)] if game else []
+        return self
+
+class FakeCallbackQuery:
+    """Нажатие кнопки под сообщением message_id в чате chat_id."""
+    def __init__(self, data, user_id, first_name, chat_id, message_id):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, first_name=first_name)
+        self.message = SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id)
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+class StubTelegramBot:
+    """Бот Telegram без сети: запоминает вызовы и отвечает через latency секунд."""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []  # (метод, время завершения)
+        self._next_message_id = 0
+
+    async def _call(self, method):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls.append((method, time.perf_counter()))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call("send_message")
+        self._next_message_id += 1
+        return SimpleNamespace(message_id=self._next_message_id, chat_id=chat_id, text=text)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        await self._call("edit_message_text")
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        await self._call("delete_message")
+        return True
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        await self._call("delete_messages")
+        return True
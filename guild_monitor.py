@@ -0,0 +1,156 @@
+# guild_monitor.py
+"""Состояние мониторинга одного сервера Discord и его статусного сообщения в Telegram.
+
+У каждого сервера свой чат, свое сообщение, своя задача отложенного обновления и своя
+блокировка, поэтому медленная правка в одном чате не задерживает обновления других.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+
+import async_database as db
+import config
+import health
+import log_setup
+import metrics
+import utils
+from debounce import Debouncer
+from status_renderer import StatusRenderer
+
+class GuildMonitor:
+    def __init__(self, guild_id, chat_id, bot, edit_scheduler, is_member=None):
+        self.guild_id, self.chat_id = guild_id, chat_id
+        self.bot, self.edit_scheduler = bot, edit_scheduler
+        # is_member(uid) -> bool: относится ли пользователь к серверу (для блока "Были сегодня")
+        self.is_member = is_member or (lambda uid: True)
+        self.voice_users, self.coming_soon_users = {}, {}
+        self.message_id = None
+        self.active_channel_link, self.last_voice_session_end_time = None, None
+        self.update_lock = asyncio.Lock()
+        self.debouncer = Debouncer(self._update_message, config.STATUS_DEBOUNCE_SECONDS, config.STATUS_DEBOUNCE_MAX_WAIT_SECONDS)
+        self.renderer = StatusRenderer()
+
+    def add_coming_soon_user(self, user_id, user_name):
+        if user_id in self.voice_users: return
+        print(f"INFO: [{self.guild_id}] Пользователь {user_name} ({user_id}) добавлен в список 'Скоро зайду'.")
+        expiration_time = datetime.now(utils.MOSCOW_TZ) + timedelta(minutes=30)
+        self.coming_soon_users[user_id] = {"name": user_name, "expires_at": expiration_time}
+
+    async def repost_message(self):
+        if self.message_id:
+            try: await self.bot.delete_message(self.chat_id, self.message_id)
+            except BadRequest: pass
+            self.edit_scheduler.forget(self.chat_id, self.message_id)
+        self.message_id = None
+        await self.schedule_update(force_creation=True)
+
+    async def format_message(self):
+        voice_users, coming_soon_users, renderer = self.voice_users, self.coming_soon_users, self.renderer
+        now = datetime.now(utils.MOSCOW_TZ)
+
+        if voice_users:
+            lines = ["🟢 **Онлайн:**"]
+        else:
+            lines = ["🔴 **Офлайн**"]
+
+        tg_ids = db.get_telegram_ids(voice_users.keys() | coming_soon_users.keys())
+        for uid, data in sorted(voice_users.items(), key=lambda i: i[1]['join_time']):
+            coming_soon_users.pop(uid, None)
+            dur = utils.format_duration((now - data['join_time']).total_seconds())
+            lines.append(await renderer.voice_user_line(uid, data, tg_ids.get(uid), dur))
+
+        if voice_users:
+            lines.append("")
+
+        expired_users = [uid for uid, data in coming_soon_users.items() if now > data['expires_at']]
+        for uid in expired_users:
+            print(f"INFO: [{self.guild_id}] Пользователь {coming_soon_users[uid]['name']} удален из 'Скоро зайду' по тайм-ауту.")
+            del coming_soon_users[uid]
+
+        today_stats = await renderer.today_stats(db.get_daily_stats)
+        filtered_today_stats = [s for s in today_stats if s[0] not in voice_users and self.is_member(s[0])]
+
+        # ИЗМЕНЕНИЕ: Добавляем пустую строку после "Офлайн" для красоты
+        if not voice_users and (coming_soon_users or filtered_today_stats):
+            lines.append("")
+
+        if coming_soon_users:
+            lines.append("🚶‍♂️ **Скоро зайдет:**")
+            for uid, data in coming_soon_users.items():
+                lines.append(f"• {renderer.link(uid, data['name'], tg_ids.get(uid))}")
+            lines.append("")
+
+        if filtered_today_stats:
+            lines.append("🗓 **Были сегодня:**")
+            today_tg_ids = db.get_telegram_ids(s[0] for s in filtered_today_stats)
+            for uid, name, secs in filtered_today_stats:
+                lines.append(f"• {renderer.link(uid, name, today_tg_ids.get(uid))} - {utils.format_duration(secs)}")
+
+        return "\n".join(lines).strip()
+
+    # --- Логика отправки и обновления сообщений ---
+
+    async def _update_message(self, text_override=None, mode="main", force_creation=False):
+        """Выполняет обновление, накопленное планировщиком."""
+        async with self.update_lock:
+            log_setup.print_sampled(("update", self.guild_id), f"INFO: [{self.guild_id}] Запускаю отложенное обновление...")
+            await self.send_or_edit_message(text_override, mode, force_creation)
+
+    async def schedule_update(self, text_override=None, mode=None, force_creation=False):
+        """Планирует отложенное обновление; события за окно группировки сливаются в одну отрисовку."""
+        self.debouncer.trigger(text_override, mode, force_creation)
+
+    async def send_or_edit_message(self, text_override=None, mode="main", force_creation=False):
+        is_new_message_needed = not self.message_id
+
+        if is_new_message_needed and utils.is_quiet_hours() and not force_creation and not text_override and mode == "main":
+            print(f"INFO: [{self.guild_id}] Тихие часы. Создание нового сообщения подавлено.")
+            return
+
+        keyboard = []
+        if mode == "main":
+            if self.voice_users:
+                keyboard.append([InlineKeyboardButton("🚶‍♂️ Скоро зайду", callback_data='coming_soon')])
+        elif mode == "daily_stats":
+            keyboard.append([InlineKeyboardButton("⬅️ Назад к мониторингу", callback_data='back_to_main')])
+
+        if text_override:
+            text = text_override
+        else:
+            with metrics.timer("nexus_render_seconds"):
+                text = await self.format_message()
+        markup = InlineKeyboardMarkup(keyboard) if keyboard else None
+
+        try:
+            if not self.message_id:
+                msg = await self.edit_scheduler.send(self.chat_id, text, parse_mode=ParseMode.MARKDOWN, reply_markup=markup, disable_notification=True, disable_web_page_preview=True)
+                self.message_id = msg.message_id
+                print(f"INFO: [{self.guild_id}] Создано новое сообщение (ID: {msg.message_id})")
+            elif await self.edit_scheduler.edit(self.chat_id, self.message_id, text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True):
+                log_setup.print_sampled(("edited", self.guild_id), f"INFO: [{self.guild_id}] Сообщение (ID: {self.message_id}) отредактировано.")
+            else:
+                return
+            health.beat('last_telegram_success')
+
+        except BadRequest as e:
+            error_text = str(e).lower()
+            if "message to edit not found" in error_text:
+                print(f"INFO: [{self.guild_id}] Сообщение было удалено вручную. Пересоздаю...")
+                self.edit_scheduler.forget(self.chat_id, self.message_id)
+                self.message_id = None
+                await self.send_or_edit_message(text, mode=mode, force_creation=True) # Прямой вызов без планировщика
+            elif "message is not modified" not in error_text:
+                print(f"ERROR: [{self.guild_id}] Неожиданная ошибка BadRequest: {e}")
+                self.message_id = None
+
+        except Exception as e:
+            print(f"КРИТИЧЕСКАЯ ОШИБКА отправки [{self.guild_id}]: {e}")
+            self.message_id = None
+
+    async def announce(self, text):
+        """Отправляет разовое уведомление (например, о достижении) в чат сервера."""
+        await self.edit_scheduler.send(self.chat_id, text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+        health.beat('last_telegram_success')
@@ -0,0 +1,152 @@
+# health.py
+"""Отметки о работе бота: время запуска, последний успешный обмен с Discord, Telegram и Steam,
+число людей в войсе.
+
+Горячие пути только обновляют словарь в памяти, /status читает его же. В key_value_store
+изменившиеся значения пишутся одной транзакцией раз в HEALTH_FLUSH_SECONDS и при остановке,
+чтобы после перезапуска было видно, когда бот последний раз работал.
+
+Здесь же фоновые замеры нагрузки и пингов со скользящим окном (sample_periodically).
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+import psutil
+
+import async_database as db
+import config
+import database
+import utils
+
+KEYS = ('start_time', 'last_discord_success', 'last_telegram_success', 'last_steam_success', 'voice_users_count')
+
+_values = {}
+_dirty = set()
+
+def load():
+    """Подхватывает значения, сохраненные прошлым запуском."""
+    for key in KEYS:
+        value = database.get_key_value(key)
+        if value is not None:
+            _values[key] = datetime.fromisoformat(value) if key != 'voice_users_count' else int(value)
+
+def set_value(key, value):
+    if _values.get(key) != value:
+        _values[key] = value
+        _dirty.add(key)
+
+def beat(key):
+    """Отмечает успешную операцию текущим временем."""
+    set_value(key, datetime.now(utils.MOSCOW_TZ))
+
+def get(key):
+    return _values.get(key)
+
+def _take_dirty():
+    items = [(key, _values[key].isoformat() if isinstance(_values[key], datetime) else _values[key]) for key in _dirty]
+    _dirty.clear()
+    return items
+
+async def flush_periodically():
+    while True:
+        await asyncio.sleep(config.HEALTH_FLUSH_SECONDS)
+        items = _take_dirty()
+        if items:
+            try:
+                await db.set_key_values(items)
+            except Exception as e:
+                print(f"ERROR: Не удалось сохранить отметки о работе: {e}")
+
+def flush():
+    """Синхронно сохраняет изменившиеся значения (при остановке)."""
+    items = _take_dirty()
+    if items:
+        database.set_key_values(items)
+
+# --- Фоновые замеры для /status ---
+# Раз в HEALTH_SAMPLE_SECONDS снимаются нагрузка процесса, сеть, размер БД и задержка цикла
+# событий, раз в HEALTH_PING_SECONDS - пинги API и сверка таблиц лидеров. /status только
+# показывает накопленное окно, поэтому отвечает сразу.
+
+class Window:
+    """Замеры за последние HEALTH_WINDOW_MINUTES: (время, значение)."""
+    def __init__(self):
+        self._samples = deque()
+
+    def add(self, value, now):
+        self._samples.append((now, value))
+        while self._samples and self._samples[0][0] < now - config.HEALTH_WINDOW_MINUTES * 60:
+            self._samples.popleft()
+
+    def summary(self):
+        """{'last', 'min', 'avg', 'p95', 'trend'} или None, если замеров нет.
+
+        trend сравнивает средние первой и второй половины окна: '↑', '↓' или '→' (разница меньше 10%).
+        """
+        if not self._samples:
+            return None
+        values = [value for _, value in self._samples]
+        ordered = sorted(values)
+        half = len(values) // 2
+        trend = "→"
+        if half:
+            before, after = sum(values[:half]) / half, sum(values[half:]) / (len(values) - half)
+            if abs(after - before) > 0.1 * max(abs(before), abs(after)):
+                trend = "↑" if after > before else "↓"
+        return {"last": values[-1], "min": ordered[0], "avg": sum(values) / len(values),
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], "trend": trend}
+
+windows = {}  # название -> Window
+latest = {}  # последние значения без окна: сетевые счетчики с запуска, расхождения таблиц лидеров
+
+def record_sample(name, value, now):
+    windows.setdefault(name, Window()).add(value, now)
+
+def summary(name):
+    window = windows.get(name)
+    return window.summary() if window else None
+
+async def sample_periodically(discord_latency):
+    """discord_latency: функция, возвращающая задержку шлюза Discord в секундах или None, если не подключен."""
+    process = psutil.Process(os.getpid())
+    process.cpu_percent(None)  # первый вызов только запоминает точку отсчета
+    net = psutil.net_io_counters()
+    lag = (utils.loop_lag_stats["samples"], utils.loop_lag_stats["total_ms"])
+    last, last_ping = time.monotonic(), None
+    while True:
+        await asyncio.sleep(config.HEALTH_SAMPLE_SECONDS)
+        now = time.monotonic()
+        elapsed, last = now - last, now
+        record_sample("cpu_percent", process.cpu_percent(None), now)
+        record_sample("rss_mb", process.memory_info().rss / (1024 * 1024), now)
+        current = psutil.net_io_counters()
+        record_sample("net_sent_kbps", (current.bytes_sent - net.bytes_sent) / elapsed / 1024, now)
+        record_sample("net_recv_kbps", (current.bytes_recv - net.bytes_recv) / elapsed / 1024, now)
+        net = current
+        latest["net_sent_mb"], latest["net_recv_mb"] = current.bytes_sent / (1024 * 1024), current.bytes_recv / (1024 * 1024)
+        record_sample("db_size_mb", sum(os.path.getsize(path) for path in (database.DB_FILE, database.DB_FILE + '-wal') if os.path.exists(path)) / (1024 * 1024), now)
+        # Сводку задержек monitor_loop_lag периодически обнуляет, тогда считаем от нуля
+        samples, total_ms = utils.loop_lag_stats["samples"], utils.loop_lag_stats["total_ms"]
+        if samples < lag[0]:
+            lag = (0, 0.0)
+        if samples > lag[0]:
+            record_sample("loop_lag_ms", (total_ms - lag[1]) / (samples - lag[0]), now)
+        lag = (samples, total_ms)
+
+        if last_ping is None or now - last_ping >= config.HEALTH_PING_SECONDS:
+            last_ping = now
+            telegram_ping, steam_ping = await asyncio.gather(utils.measure_telegram_ping(), utils.measure_steam_ping())
+            for name, ping in (("telegram_ping_ms", telegram_ping), ("steam_ping_ms", steam_ping)):
+                if ping != -1:
+                    record_sample(name, ping, now)
+                latest[name + "_failed"] = ping == -1
+            discord_ping = discord_latency()
+            if discord_ping is not None:
+                record_sample("discord_ping_ms", discord_ping * 1000, now)
+            try:
+                latest["leaderboard_mismatches"] = len(await db.verify_leaderboards())
+            except Exception as e:
+                print(f"ERROR: Сверка таблиц лидеров: {e}")
@@ -0,0 +1,104 @@
+# http_client.py
+"""Общий асинхронный HTTP-клиент для всех исходящих запросов (Steam API, проверки пингов).
+
+Одна сессия aiohttp на все время работы приложения: соединения переиспользуются (keep-alive),
+число соединений к одному хосту ограничено, у каждого запроса есть таймаут,
+а временные ошибки (429, 5xx, сетевые сбои) повторяются с растущей паузой.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import config
+import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+# Счетчики для проверки переиспользования соединений
+stats = {"requests": 0, "retries": 0, "new_connections": 0, "reused_connections": 0}
+metrics.add_collector("nexus_http", stats)
+
+async def _on_connection_create(session, context, params):
+    stats["new_connections"] += 1
+
+async def _on_connection_reuse(session, context, params):
+    stats["reused_connections"] += 1
+
+def get_session():
+    """Возвращает общую сессию, создавая ее при первом обращении (только внутри цикла событий)."""
+    global _session
+    if _session is None or _session.closed:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(_on_connection_create)
+        trace_config.on_connection_reuseconn.append(_on_connection_reuse)
+        connector = aiohttp.TCPConnector(
+            limit=config.HTTP_MAX_CONNECTIONS, limit_per_host=config.HTTP_MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=config.HTTP_KEEPALIVE_SECONDS, ttl_dns_cache=300
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector, trace_configs=[trace_config],
+            timeout=aiohttp.ClientTimeout(total=config.HTTP_TIMEOUT_SECONDS)
+        )
+    return _session
+
+async def start():
+    get_session()
+
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+def _retry_delay(attempt, response=None):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return config.HTTP_RETRY_BACKOFF_SECONDS * (2 ** attempt)
+
+async def get_json(url, params=None, retries=None):
+    """GET с разбором JSON. Временные ошибки повторяются; после исчерпания попыток исключение пробрасывается."""
+    retries = config.HTTP_RETRIES if retries is None else retries
+    host = urlsplit(url).netloc
+    for attempt in range(retries + 1):
+        stats["requests"] += 1
+        try:
+            with metrics.timer("nexus_http_request_seconds", host=host):
+                async with get_session().get(url, params=params) as response:
+                    if response.status in RETRY_STATUSES and attempt < retries:
+                        metrics.inc("nexus_http_errors_total", host=host)
+                        delay = _retry_delay(attempt, response)
+                    else:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            metrics.inc("nexus_http_errors_total", host=host)
+            if attempt >= retries:
+                raise
+            delay = _retry_delay(attempt)
+        stats["retries"] += 1
+        await asyncio.sleep(delay)
+
+@asynccontextmanager
+async def stream(url, read_timeout=60):
+    """Открывает ответ для чтения по частям (response.content.iter_chunked) без общего ограничения времени."""
+    stats["requests"] += 1
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=config.HTTP_TIMEOUT_SECONDS, sock_read=read_timeout)
+    async with get_session().get(url, timeout=timeout) as response:
+        response.raise_for_status()
+        yield response
+
+async def measure_latency(url, timeout=5):
+    """Время ответа в мс (один запрос без повторов) или -1 при ошибке."""
+    stats["requests"] += 1
+    start_time = time.monotonic()
+    try:
+        async with get_session().get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            await response.read()
+        return (time.monotonic() - start_time) * 1000
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return -1
@@ -0,0 +1,54 @@
+# journal.py
+"""Журнал входящих событий для воспроизведения (python manage.py replay).
+
+Если задан JOURNAL_FILE, события голосовых каналов, смены игр пользователей в войсе,
+снимки состояния при подключении и нажатия кнопок в Telegram дописываются в файл
+по одной компактной JSON-строке. Запись идет в буфер, на диск он сбрасывается раз
+в JOURNAL_FLUSH_SECONDS и при остановке.
+
+Поля: t - время (unix, с), e - тип (voice, presence, ready, callback), g - сервер,
+u - пользователь, n - имя, b/a - канал до/после, s/v - стрим/камера, p - игра,
+m - участники в войсе при подключении, f - имя в Telegram, d - данные кнопки.
+"""
+import asyncio
+import json
+import time
+
+import config
+
+_file = None
+
+def open_journal(path=None):
+    global _file
+    path = config.JOURNAL_FILE if path is None else path
+    if path and _file is None:
+        _file = open(path, "a", encoding="utf-8", buffering=64 * 1024)
+        print(f"INFO: Журнал событий пишется в {path}")
+    return _file is not None
+
+def record(kind, **fields):
+    if _file is None:
+        return
+    fields["t"], fields["e"] = round(time.time(), 3), kind
+    _file.write(json.dumps(fields, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+async def flush_periodically():
+    while _file is not None:
+        await asyncio.sleep(config.JOURNAL_FLUSH_SECONDS)
+        if _file is not None:
+            _file.flush()
+
+def close_journal():
+    global _file
+    if _file is not None:
+        _file.close()
+        _file = None
+
+def read(path):
+    """Записи журнала по порядку (битая последняя строка после аварийной остановки пропускается)."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"ERROR: Пропущена поврежденная запись журнала: {line[:80]!r}")
@@ -0,0 +1,52 @@
+# leaderboard.py
+"""Таблицы лидеров в памяти для /time, /games, /king и места в /mystats.
+
+Загружаются один раз при старте (database.load_leaderboards) и обновляются на месте
+при каждом закрытии сессии (database.update_stats), поэтому команды не выполняют
+сортировку таблиц users и games.
+"""
+import bisect
+import threading
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores = {}
+        self._names = {}
+        self._order = []  # отсортированный список (-секунды, ключ)
+
+    def load(self, rows):
+        """rows: (ключ, секунды, имя)."""
+        with self._lock:
+            self._scores = {key: seconds or 0 for key, seconds, _ in rows}
+            self._names = {key: name for key, _, name in rows}
+            self._order = sorted((-seconds, key) for key, seconds in self._scores.items())
+
+    def add(self, key, seconds, name=None):
+        with self._lock:
+            old = self._scores.get(key)
+            if old is not None:
+                del self._order[bisect.bisect_left(self._order, (-old, key))]
+            new = (old or 0) + seconds
+            self._scores[key] = new
+            if name is not None:
+                self._names[key] = name
+            bisect.insort(self._order, (-new, key))
+
+    def top(self, limit, min_seconds=0):
+        """Первые limit записей [(ключ, имя, секунды)] с результатом больше min_seconds."""
+        with self._lock:
+            return [(key, self._names.get(key), -score) for score, key in self._order[:limit] if -score > min_seconds]
+
+    def rank(self, key):
+        """Место (с 1) или None, если ключа нет в таблице."""
+        with self._lock:
+            score = self._scores.get(key)
+            return None if score is None else bisect.bisect_left(self._order, (-score, key)) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._scores)
+
+users = Leaderboard()
+games = Leaderboard()
@@ -0,0 +1,107 @@
+# log_setup.py
+"""Логирование без блокировки цикла событий.
+
+print заменяется функцией, которая только кладет запись в очередь (QueueHandler); запись в
+файл с ротацией и вывод в консоль выполняет фоновый поток (QueueListener). При LOG_FORMAT=json
+строки пишутся JSON-объектами, а записи из обработчиков событий Discord получают поля
+handler, user, guild и elapsed_ms (время с начала обработчика, см. metrics.timed_handler).
+
+Частые однотипные строки (плановое обновление, правка сообщения) выводятся через print_sampled:
+не чаще раза в LOG_SAMPLE_SECONDS, с числом пропущенных.
+"""
+import builtins
+import contextvars
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import config
+
+# Поля текущего обработчика события: {"handler", "user", "guild", "started"}
+event_fields = contextvars.ContextVar("event_fields", default=None)
+
+class _EventFilter(logging.Filter):
+    """Добавляет к записи поля текущего обработчика (выполняется в потоке, который пишет в лог)."""
+    def filter(self, record):
+        fields = event_fields.get()
+        if fields:
+            record.event = {key: value for key, value in fields.items() if key != "started" and value is not None}
+            record.event["elapsed_ms"] = round((time.perf_counter() - fields["started"]) * 1000, 2)
+        return True
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Запись больше никуда не передается, поэтому вместо копии и форматирования (как в QueueHandler)
+        # только подставляем аргументы, чтобы поток записи не зависел от изменяемых объектов
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {"t": self.formatTime(record), "level": record.levelname, "msg": record.getMessage()}
+        data.update(getattr(record, "event", {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False)
+
+def _level(text):
+    return logging.ERROR if text.startswith(("ERROR", "КРИТИЧЕСКАЯ")) else logging.INFO
+
+def setup_logging():
+    """Настраивает логирование в консоль и в файл через фоновый поток. Возвращает listener для остановки."""
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+
+    if config.LOG_FORMAT == 'json':
+        log_formatter = JsonFormatter()
+    else:
+        log_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+
+    log_handler = RotatingFileHandler('logs/bot.log', maxBytes=5*1024*1024, backupCount=2, encoding='utf-8')
+    log_handler.setFormatter(log_formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(log_formatter)
+
+    # Имя файла, строка вызова и процесс в записях не используются, а их поиск заметно удлиняет вызов
+    logging._srcfile = None
+    logging.logProcesses = logging.logMultiprocessing = False
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(_EventFilter())
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, log_handler, console_handler, respect_handler_level=True)
+    listener.start()
+
+    original_print = builtins.print
+
+    def log_print(*args, **kwargs):
+        # Вывод в явно указанный файл (так, например, traceback собирает текст исключения) не перехватывается
+        if kwargs.get('file') is not None:
+            return original_print(*args, **kwargs)
+        text = ' '.join(map(str, args))
+        logging.log(_level(text), text)
+
+    builtins.print = log_print
+    return listener
+
+_sampled = {}  # ключ -> (время последнего вывода, пропущено с тех пор)
+
+def print_sampled(key, text):
+    """Выводит строку не чаще раза в LOG_SAMPLE_SECONDS для данного ключа, дописывая число пропущенных."""
+    now = time.monotonic()
+    last, skipped = _sampled.get(key, (None, 0))
+    if last is not None and now - last < config.LOG_SAMPLE_SECONDS:
+        _sampled[key] = (last, skipped + 1)
+        return
+    _sampled[key] = (now, 0)
+    print(f"{text} (еще {skipped} таких строк пропущено)" if skipped else text)
@@ -1,48 +1,55 @@
 # main.py
 import asyncio
-import logging
-import os
-from logging.handlers import RotatingFileHandler
 
+import async_database
 import database
 import discord_bot
+import health
+import http_client
+import journal
+import log_setup
+import metrics
+import retention
 import telegram_bot
 import utils
 
-def setup_logging():
-    """Настраивает логирование в консоль и в файл."""
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-        
-    log_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-    
-    log_handler = RotatingFileHandler('logs/bot.log', maxBytes=5*1024*1024, backupCount=2, encoding='utf-8')
-    log_handler.setFormatter(log_formatter)
-    
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(log_handler)
-    
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(log_formatter)
-    root_logger.addHandler(console_handler)
-
-    def log_print(*args, **kwargs):
-        logging.info(' '.join(map(str, args)))
-    
-    __builtins__.print = log_print
-
 async def main():
     """Главная асинхронная функция для запуска всех систем."""
     print("--- [Nexus Bot v1.0] Инициализация систем ---")
     
     database.init_db()
+    health.load()
+    await http_client.start()
+    metrics_server = await metrics.serve()
+    journal_flusher = asyncio.create_task(journal.flush_periodically()) if journal.open_journal() else None
+    health_flusher = asyncio.create_task(health.flush_periodically())
+    health_sampler = asyncio.create_task(health.sample_periodically(
+        lambda: discord_bot.client.latency if discord_bot.client.is_ready() else None))
+    lag_monitor = asyncio.create_task(utils.monitor_loop_lag())
+    compaction = asyncio.create_task(retention.run_periodically())
     
-    await asyncio.gather(
-        discord_bot.run(),
-        telegram_bot.run()
-    )
+    try:
+        await asyncio.gather(
+            discord_bot.run(),
+            telegram_bot.run()
+        )
+    finally:
+        health_flusher.cancel()
+        health_sampler.cancel()
+        lag_monitor.cancel()
+        compaction.cancel()
+        if metrics_server:
+            metrics_server.close()
+        if journal_flusher:
+            journal_flusher.cancel()
+        journal.close_journal()
+        await http_client.close()
+        health.flush()
+        async_database.shutdown()
 
 if __name__ == "__main__":
-    setup_logging()
-    asyncio.run(main())
+    listener = log_setup.setup_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        listener.stop()
@@ -0,0 +1,56 @@
+# manage.py
+"""Служебные команды обслуживания базы данных.
+
+Запуск: python manage.py <команда>
+"""
+import argparse
+import asyncio
+
+import async_database
+import database
+import replay
+import retention
+
+def backfill_daily(args):
+    database.init_db()
+    rows = database.backfill_daily_user_stats()
+    print(f"Дневная сводка пересобрана по истории сессий: {rows} строк.")
+
+def backfill_achievements(args):
+    database.init_db()
+    grants = database.backfill_achievements()
+    print(f"Выдано ачивок по накопленной статистике: {len(grants)}.")
+
+def compact(args):
+    database.init_db()
+    asyncio.run(retention.compact_history(args.days, enable_incremental_vacuum=True))
+    async_database.shutdown()
+
+def replay_journal(args):
+    replay.replay(args.journal, speed=args.speed, from_db=args.from_db, compare=args.compare, out=args.out)
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных Nexus Bot")
+    parser.add_argument("--db", default=database.DB_FILE, help="Путь к файлу БД")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill-daily", help="Пересобрать дневную сводку daily_user_stats из voice_sessions").set_defaults(func=backfill_daily)
+    commands.add_parser("backfill-achievements", help="Выдать всем пользователям ачивки, на которые они уже наработали").set_defaults(func=backfill_achievements)
+    compact_parser = commands.add_parser("compact", help="Свернуть старые сессии в помесячные итоги и освободить место (при необходимости включает incremental vacuum)")
+    compact_parser.add_argument("--days", type=int, default=None, help="Хранить подробную историю за столько дней")
+    compact_parser.set_defaults(func=compact)
+    replay_parser = commands.add_parser("replay", help="Воспроизвести журнал событий на отдельной БД (рабочая БД не затрагивается)")
+    replay_parser.add_argument("journal", help="Файл журнала (JOURNAL_FILE)")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Ускорение относительно исходного темпа (0 - без пауз)")
+    replay_parser.add_argument("--from-db", default=None, help="Начать с копии этой БД (снимок до начала журнала)")
+    replay_parser.add_argument("--compare", default=None, help="Сравнить итоги с этой БД (например, рабочей после того же вечера)")
+    replay_parser.add_argument("--out", default=None, help="Сохранить БД воспроизведения в этот файл")
+    replay_parser.set_defaults(func=replay_journal)
+    args = parser.parse_args()
+    database.DB_FILE = args.db
+    try:
+        args.func(args)
+    finally:
+        database.close_connections()
+
+if __name__ == "__main__":
+    main()
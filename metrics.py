@@ -0,0 +1,189 @@
+# metrics.py
+"""Счетчики и гистограммы задержек с выдачей в текстовом формате Prometheus.
+
+Запись метрики - это поиск в словаре и пара сложений под коротким локом (метрики БД
+пишутся из потоков пула). Готовые словари статистики модулей (http_client.stats и т.п.)
+подключаются через add_collector и читаются только в момент запроса /metrics.
+"""
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+import log_setup
+
+# Границы корзин гистограмм (в секундах)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}  # (имя, метки) -> значение
+_histograms = {}  # (имя, метки) -> Histogram
+_collectors = []  # (префикс, словарь или функция, возвращающая словарь)
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def quantile(self, q):
+        """Оценка квантиля сверху: граница корзины, в которую он попадает (в секундах).
+
+        Если квантиль выше последней границы, возвращается inf: верхней оценки нет.
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def format_quantile(self, q):
+        """'≤ 250 мс' или '> 10000 мс', если квантиль выше последней границы."""
+        bound = self.quantile(q)
+        return f"≤ {bound * 1000:g} мс" if bound != float('inf') else f"> {BUCKETS[-1] * 1000:g} мс"
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram.sum += seconds
+        histogram.count += 1
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def timed_handler(event):
+    """Декоратор обработчика события Discord: время выполнения, число ошибок и поля для записей лога."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            member = args[0] if args else None
+            token = log_setup.event_fields.set({"handler": event, "user": getattr(member, "id", None),
+                                                "guild": getattr(getattr(member, "guild", None), "id", None), "started": started})
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                inc("nexus_discord_event_errors_total", event=event)
+                raise
+            finally:
+                log_setup.event_fields.reset(token)
+                observe("nexus_discord_event_seconds", time.perf_counter() - started, event=event)
+        return wrapper
+    return decorator
+
+def add_collector(prefix, source):
+    """Числовые значения словаря source (или результата source()) выдаются как prefix_<ключ>."""
+    _collectors.append((prefix, source))
+
+def histograms(name):
+    """[(метки, Histogram)] для сводки в /status (копии, чтобы не держать лок)."""
+    with _lock:
+        result = []
+        for (metric, labels), histogram in _histograms.items():
+            if metric == name:
+                copy = Histogram()
+                copy.counts, copy.sum, copy.count = histogram.counts[:], histogram.sum, histogram.count
+                result.append((dict(labels), copy))
+        return result
+
+def merged(name):
+    """Одна гистограмма по всем меткам метрики."""
+    total = Histogram()
+    for _, histogram in histograms(name):
+        total.counts = [a + b for a, b in zip(total.counts, histogram.counts)]
+        total.sum += histogram.sum
+        total.count += histogram.count
+    return total
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+def render():
+    """Все метрики в текстовом формате Prometheus."""
+    with _lock:
+        counters = sorted(_counters.items())
+        hist_items = sorted((key, h.counts[:], h.sum, h.count) for key, h in _histograms.items())
+    lines, typed = [], set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), counts, total, count in hist_items:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    for prefix, source in _collectors:
+        values = source() if callable(source) else source
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+async def _handle_scrape(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        if request_line.split(b" ")[1:2] in ([b"/metrics"], [b"/"]):
+            body, status = render().encode(), "200 OK"
+        else:
+            body, status = b"not found\n", "404 Not Found"
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host=None, port=None):
+    """Запускает локальный HTTP-сервер /metrics. Возвращает asyncio.Server или None, если порт не задан."""
+    host = config.METRICS_HOST if host is None else host
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(_handle_scrape, host, port)
+    except OSError as e:
+        # Метрики необязательны: занятый порт или нет прав не должны мешать запуску бота
+        print(f"ERROR: Не удалось открыть метрики на {host}:{port}: {e}. Продолжаю без /metrics.")
+        return None
+    print(f"INFO: Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,178 @@
+# replay.py
+"""Воспроизведение журнала событий (journal.py) через обработчики discord_bot и telegram_bot.
+
+Работает на отдельной БД (пустой или копии снимка --from-db), Telegram заменен заглушкой.
+Часы бота подменяются временем из записей журнала, а обработчики вызываются по очереди,
+поэтому длительности сессий не зависят от скорости воспроизведения: при --speed 1 события
+идут с исходными паузами, при --speed 60 - в 60 раз быстрее, при --speed 0 - без пауз.
+Пороги, заданные в секундах (отложенное обновление, лимиты Telegram), масштабируются
+на ту же скорость. Троттлинг смены игр отключается: он опирается на реальное время
+и сделал бы итоги по играм зависящими от скорости.
+"""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import async_database as db
+import config
+import database
+import journal
+import utils
+from fakes import FakeCallbackQuery, FakeChannel, FakeGuild, FakeMember, FakeVoiceState, StubTelegramBot
+
+# Во сколько раз ускорять пороги при --speed 0
+UNLIMITED_SPEED_SCALE = 1000
+
+class ReplayClock(datetime):
+    """datetime, у которого now() - время текущей воспроизводимой записи."""
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current.astimezone(tz) if tz else cls.current.replace(tzinfo=None)
+
+def snapshot(path):
+    """Итоги БД для сравнения: время по пользователям и играм, число сессий."""
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        return {
+            "users": {user_id: (name, total or 0) for user_id, name, total in conn.execute("SELECT id, name, total_seconds FROM users")},
+            "games": {name: total or 0 for name, total in conn.execute("SELECT name, total_seconds FROM games")},
+            "sessions": conn.execute("SELECT COUNT(*) FROM voice_sessions").fetchone()[0],
+        }
+
+def print_diff(replayed, reference, limit=10):
+    diffs = []
+    for user_id in replayed["users"].keys() | reference["users"].keys():
+        name, got = replayed["users"].get(user_id, (None, 0))
+        ref_name, expected = reference["users"].get(user_id, (None, 0))
+        if got != expected:
+            diffs.append((abs(got - expected), f"пользователь {name or ref_name} ({user_id}): {utils.format_duration(expected)} -> {utils.format_duration(got)}"))
+    for game in replayed["games"].keys() | reference["games"].keys():
+        got, expected = replayed["games"].get(game, 0), reference["games"].get(game, 0)
+        if got != expected:
+            diffs.append((abs(got - expected), f"игра {game}: {utils.format_duration(expected)} -> {utils.format_duration(got)}"))
+    print(f"Сессий: эталон {reference['sessions']}, воспроизведение {replayed['sessions']}")
+    if not diffs:
+        print("Итоги по пользователям и играм совпадают с эталоном.")
+        return
+    print(f"Расхождений: {len(diffs)}, крупнейшие:")
+    for _, line in sorted(diffs, key=lambda d: d[0], reverse=True)[:limit]:
+        print(f"  {line}")
+
+def _patch_timing(scale):
+    names = ("STATUS_DEBOUNCE_SECONDS", "STATUS_DEBOUNCE_MAX_WAIT_SECONDS", "GROUP_COMMIT_WINDOW_SECONDS")
+    saved = {name: getattr(config, name) for name in names + ("TELEGRAM_CHAT_MESSAGES_PER_MINUTE", "PRESENCE_THROTTLE_SECONDS")}
+    for name in names:
+        setattr(config, name, saved[name] / scale)
+    config.TELEGRAM_CHAT_MESSAGES_PER_MINUTE = saved["TELEGRAM_CHAT_MESSAGES_PER_MINUTE"] * scale
+    config.PRESENCE_THROTTLE_SECONDS = 0
+    return saved
+
+async def _run(records, speed):
+    import discord_bot
+    import guild_monitor
+    import telegram_bot
+    bot = StubTelegramBot()
+    discord_bot.telegram_bot = bot
+    discord_bot.edit_scheduler.bot = bot
+    discord_bot.TELEGRAM_CHAT_ID, discord_bot.GUILD_CHAT_IDS = "-100", {}
+    guilds, members, channels = {}, {}, {}
+    discord_bot.client.get_guild = guilds.get
+    patched = (discord_bot, guild_monitor, utils)
+    for module in patched:
+        module.datetime = ReplayClock
+    callbacks = {
+        "coming_soon": telegram_bot.coming_soon_callback, "refresh": telegram_bot.refresh_callback,
+        "daily_stats": telegram_bot.daily_stats_callback, "back_to_main": telegram_bot.back_to_main_callback,
+    }
+
+    def member(guild_id, user_id, name, game):
+        guild = guilds.get(guild_id) or guilds.setdefault(guild_id, FakeGuild(guild_id, f"Сервер {guild_id}"))
+        m = members.get((guild_id, user_id)) or members.setdefault((guild_id, user_id), FakeMember(user_id, guild, name))
+        m.display_name = name
+        m.play(None if game == "Неизвестно" else game)
+        return m
+
+    def voice(channel_id, stream=False, video=False):
+        if channel_id is None:
+            return None
+        return FakeVoiceState(channels.setdefault(channel_id, FakeChannel(channel_id)), stream, video)
+
+    counts = {}
+    started, first_t = time.perf_counter(), records[0]["t"]
+    try:
+        for rec in records:
+            if speed:
+                await asyncio.sleep(max(0.0, started + (rec["t"] - first_t) / speed - time.perf_counter()))
+            ReplayClock.current = datetime.fromtimestamp(rec["t"], utils.MOSCOW_TZ)
+            kind = rec["e"]
+            counts[kind] = counts.get(kind, 0) + 1
+            if kind == "voice":
+                m = member(rec["g"], rec["u"], rec["n"], rec["p"])
+                before, m.voice = m.voice or FakeVoiceState(), voice(rec["a"], rec["s"], rec["v"])
+                await discord_bot.on_voice_state_update(m, before, m.voice or FakeVoiceState())
+            elif kind == "presence":
+                m = member(rec["g"], rec["u"], rec["n"], rec["p"])
+                await discord_bot.on_presence_update(m, m)
+            elif kind == "ready":
+                for m in members.values():
+                    m.voice = None
+                for guild_id, user_id, name, channel_id, stream, video, game in rec["m"]:
+                    member(guild_id, user_id, name, game).voice = voice(channel_id, stream, video)
+                await discord_bot.restore_voice_state(list(guilds.values()))
+            elif kind == "callback":
+                monitor = discord_bot.monitors.get(rec["g"])
+                handler = callbacks.get(rec["d"])
+                if monitor and handler:
+                    query = FakeCallbackQuery(rec["d"], rec["u"], rec["f"], monitor.chat_id, monitor.message_id)
+                    await handler(SimpleNamespace(callback_query=query, effective_chat=query.message.chat), None)
+        while not all(m.debouncer.idle for m in discord_bot.monitors.values()):
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    finally:
+        for module in patched:
+            module.datetime = datetime
+        for m in discord_bot.monitors.values():
+            m.debouncer.cancel()
+
+    total = sum(counts.values())
+    span = records[-1]["t"] - first_t
+    calls = {}
+    for method, _ in bot.calls:
+        calls[method] = calls.get(method, 0) + 1
+    print(f"Воспроизведено {total} записей {counts} за {elapsed:.2f} с ({total / elapsed:.0f} событий/с), "
+          f"в журнале {utils.format_duration(span)}")
+    print(f"Telegram: {sum(calls.values())} вызовов {calls}, обновлений статуса: "
+          f"{sum(m.debouncer.stats['renders'] for m in discord_bot.monitors.values())}")
+    print(f"В войсе в конце: {sum(len(m.voice_users) for m in discord_bot.monitors.values())}")
+
+def replay(journal_path, speed=1.0, from_db=None, compare=None, out=None):
+    """Воспроизводит журнал на отдельной БД; при compare сравнивает итоги с эталонной БД."""
+    records = list(journal.read(journal_path))
+    if not records:
+        print("Журнал пуст.")
+        return
+    os.environ.setdefault('TELEGRAM_TOKEN', '123456:replay')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = out or os.path.join(tmp, "replay.db")
+        if from_db:
+            with sqlite3.connect(f"file:{from_db}?mode=ro", uri=True) as src, sqlite3.connect(path) as dst:
+                src.backup(dst)
+        database.DB_FILE = path
+        database.init_db()
+        saved = _patch_timing(speed or UNLIMITED_SPEED_SCALE)
+        try:
+            asyncio.run(_run(records, speed))
+        finally:
+            for name, value in saved.items():
+                setattr(config, name, value)
+            db.shutdown()
+            database.close_connections()
+        if compare:
+            print_diff(snapshot(path), snapshot(compare))
+        if out:
+            print(f"БД воспроизведения сохранена: {out}")
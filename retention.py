@@ -0,0 +1,74 @@
+# retention.py
+"""Хранение истории voice_sessions: сессии старше SESSION_RETENTION_DAYS сворачиваются
+в помесячные итоги по пользователю и игре (суммы сохраняются точно), после чего
+освободившееся место возвращается через incremental vacuum.
+
+БД, созданная до включения auto_vacuum=INCREMENTAL, переводится в этот режим однократным
+полным VACUUM только командой python manage.py compact; фоновый проход такую БД не трогает.
+
+Работа идет небольшими пачками в потоке БД с паузами, чтобы не мешать основной записи.
+"""
+import asyncio
+from datetime import timedelta
+
+import async_database as db
+import config
+import database
+import utils
+
+async def compact_history(retention_days=None, enable_incremental_vacuum=False):
+    """Один проход компактизации. Возвращает отчет.
+
+    enable_incremental_vacuum: при необходимости перевести БД в режим INCREMENTAL полным VACUUM
+    (блокирует запись на все время перезаписи файла).
+    """
+    retention_days = config.SESSION_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = utils.get_day_start_time() - timedelta(days=retention_days)
+    page_size, pages_before, _ = await db.run(database.get_database_pages)
+
+    previous_cutoff = await db.get_key_value('sessions_compacted_before')
+    if not previous_cutoff or previous_cutoff < cutoff.isoformat():
+        # Граница записывается заранее: backfill дневной сводки не должен пересобирать сворачиваемые дни
+        await db.set_key_value('sessions_compacted_before', cutoff.isoformat())
+
+    folded = folded_seconds = 0
+    while True:
+        count, seconds = await db.run(database.compact_voice_sessions_batch, cutoff, config.COMPACTION_BATCH_SIZE)
+        folded += count
+        folded_seconds += seconds
+        if count < config.COMPACTION_BATCH_SIZE:
+            break
+        await asyncio.sleep(config.COMPACTION_PAUSE_SECONDS)
+
+    if enable_incremental_vacuum and await db.run(database.enable_incremental_vacuum):
+        print("INFO: БД переведена в режим auto_vacuum=INCREMENTAL.")
+    _, _, free_pages = await db.run(database.get_database_pages)
+    if free_pages and not await db.run(database.is_incremental_vacuum):
+        print(f"INFO: Свободных страниц: {free_pages}, но auto_vacuum не в режиме INCREMENTAL. "
+              f"Место не освобождается; для перевода выполните python manage.py compact.")
+        free_pages = 0
+    while free_pages:
+        await db.run(database.incremental_vacuum, config.INCREMENTAL_VACUUM_PAGES)
+        _, _, remaining = await db.run(database.get_database_pages)
+        if remaining >= free_pages:
+            break  # страницы больше не освобождаются
+        free_pages = remaining
+        await asyncio.sleep(config.COMPACTION_PAUSE_SECONDS)
+
+    _, pages_after, _ = await db.run(database.get_database_pages)
+    report = {
+        "cutoff": cutoff, "sessions_folded": folded, "seconds_folded": folded_seconds,
+        "bytes_saved": (pages_before - pages_after) * page_size,
+    }
+    print(f"INFO: Компактизация истории до {cutoff:%Y-%m-%d}: свернуто {folded} сессий "
+          f"({utils.format_duration(folded_seconds)}), освобождено {report['bytes_saved'] / 1024:.0f} КБ.")
+    return report
+
+async def run_periodically():
+    """Фоновая задача: компактизация раз в COMPACTION_INTERVAL_HOURS."""
+    while True:
+        try:
+            await compact_history()
+        except Exception as e:
+            print(f"ERROR: Компактизация истории не удалась: {e}")
+        await asyncio.sleep(config.COMPACTION_INTERVAL_HOURS * 3600)
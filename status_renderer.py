@@ -0,0 +1,61 @@
+# status_renderer.py
+"""Кэш фрагментов статусного сообщения.
+
+Между плановыми обновлениями меняются только длительности, поэтому для каждого
+пользователя запоминается готовая часть строки (ссылка, значки, ссылка на игру),
+привязанная к полям, от которых она зависит, и к поколению каталога Steam (после
+обновления каталога ссылки на игры строятся заново). Статистика "Были сегодня" кэшируется
+до закрытия очередной сессии или смены суток; ссылки на пользователей сбрасываются со сменой
+суток, чтобы кэш не рос на всех, кто когда-либо попадал в сообщение.
+"""
+import steam_catalog
+import utils
+
+def user_link(name, tg_id):
+    return f"[{utils.escape_markdown(name)}](tg://user?id={tg_id})" if tg_id else utils.escape_markdown(name)
+
+class StatusRenderer:
+    def __init__(self):
+        self._fragments = {}
+        self._links = {}
+        self._today = None
+        self.stats = {"fragment_hits": 0, "fragment_misses": 0}
+
+    def invalidate(self, uid):
+        self._fragments.pop(uid, None)
+
+    def invalidate_today(self):
+        self._today = None
+
+    async def voice_user_line(self, uid, data, tg_id, duration):
+        """Строка пользователя в войсе: кэшированный фрагмент плюс актуальная длительность."""
+        game = data.get('game', 'Неизвестно')
+        key = (data['name'], tg_id, bool(data.get('video')), bool(data.get('streaming')), game, steam_catalog.generation)
+        cached = self._fragments.get(uid)
+        if cached and cached[0] == key:
+            self.stats["fragment_hits"] += 1
+        else:
+            self.stats["fragment_misses"] += 1
+            stat = "".join([" 🎥" if data.get('video') else "", " 🔴" if data.get('streaming') else ""])
+            game_url = await utils.get_steam_app_url(game)
+            game_str = f" (играет в [{utils.escape_markdown(game)}]({game_url}))" if game_url else (f" (играет в *{utils.escape_markdown(game)}*)" if game != "Неизвестно" else "")
+            cached = self._fragments[uid] = (key, f"• {user_link(data['name'], tg_id)}{stat} - ", game_str)
+        return f"{cached[1]}{duration}{cached[2]}"
+
+    def link(self, uid, name, tg_id):
+        key = (name, tg_id)
+        cached = self._links.get(uid)
+        if cached and cached[0] == key:
+            return cached[1]
+        link = user_link(name, tg_id)
+        self._links[uid] = (key, link)
+        return link
+
+    async def today_stats(self, load):
+        """Статистика за сегодня; load(day_start) вызывается только при смене суток или после invalidate_today()."""
+        day_start = utils.get_day_start_time()
+        if not self._today or self._today[0] != day_start:
+            if self._today:
+                self._links.clear()
+            self._today = (day_start, await load(day_start))
+        return self._today[1]
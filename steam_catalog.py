@@ -0,0 +1,217 @@
+# steam_catalog.py
+"""Потоковое обновление локального каталога приложений Steam (таблица steam_apps).
+
+Ответ GetAppList разбирается по частям, приложения пишутся в промежуточную таблицу
+ограниченными пачками, а в steam_apps одной транзакцией применяется только разница
+(новые, переименованные и удаленные appid). Поиск игр во время обновления продолжает
+видеть старый каталог целиком.
+"""
+import asyncio
+import codecs
+import difflib
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import OrderedDict
+
+import psutil
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import async_database as db
+import config
+import database
+import http_client
+import metrics
+
+STEAM_APP_LIST_URL = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
+# Источник списка: URL или путь к локальному JSON-файлу (удобно для проверки без обращения к API)
+STEAM_APP_LIST_SOURCE = os.getenv('STEAM_APP_LIST_SOURCE', STEAM_APP_LIST_URL)
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 5000
+
+_TRADEMARKS = re.compile(r'[™®©℠]')
+_NON_WORD = re.compile(r'[\W_]+')
+
+# Номера и издания ("2", "iii", "2077"): у нечеткого совпадения они должны совпадать полностью
+_NUMBER_TOKENS = re.compile(r'\b(?:\d+|[ivx]+)\b')
+
+def number_tokens(norm_name):
+    return _NUMBER_TOKENS.findall(norm_name)
+
+def normalize_name(name):
+    """Приводит название игры к ключу поиска: без знаков ™/®, диакритики, пунктуации и регистра."""
+    name = unicodedata.normalize('NFKD', _TRADEMARKS.sub('', name))
+    name = ''.join(c for c in name if not unicodedata.combining(c)).casefold()
+    return ' '.join(_NON_WORD.sub(' ', name).split())
+
+_APPS_KEY = re.compile(r'"apps"\s*:\s*\[')
+_SEPARATORS = ' \t\r\n,'
+
+class AppListParser:
+    """Инкрементальный разбор JSON GetAppList: feed() принимает очередной кусок байтов
+    и возвращает готовые записи (appid, name, norm_name)."""
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ""
+        self._in_array = False
+        self.finished = False
+
+    def feed(self, chunk):
+        apps = []
+        if self.finished:
+            return apps
+        buf = self._buf + self._text_decoder.decode(chunk)
+        if not self._in_array:
+            match = _APPS_KEY.search(buf)
+            if not match:
+                self._buf = buf[-16:]  # ключ мог разорваться на границе кусков
+                return apps
+            buf, self._in_array = buf[match.end():], True
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in _SEPARATORS:
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == ']':
+                self.finished = True
+                break
+            try:
+                app, pos = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # объект еще не получен целиком
+            if 'appid' in app and app.get('name'):
+                apps.append((app['appid'], app['name'], normalize_name(app['name'])))
+        self._buf = "" if self.finished else buf[pos:]
+        return apps
+
+    def close(self):
+        if not self.finished:
+            raise ValueError("Список приложений Steam оборван до конца массива")
+
+async def _iter_source_chunks(source):
+    if source.startswith(('http://', 'https://')):
+        async with http_client.stream(source) as response:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                yield chunk
+    else:
+        with open(source, 'rb') as f:
+            while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                yield chunk
+
+def peak_rss_mb():
+    """Пиковый RSS процесса за все время работы (на Windows - текущий RSS).
+
+    tracemalloc здесь не используется: он отслеживает каждое выделение памяти во всем процессе.
+    """
+    if resource is None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+async def refresh_catalog(source=None):
+    """Обновляет каталог; разбор и запись в БД выполняются вне цикла событий. Возвращает отчет об изменениях."""
+    source = source or STEAM_APP_LIST_SOURCE
+    started, peak_before = time.monotonic(), peak_rss_mb()
+    try:
+        await db.run(database.begin_steam_apps_staging)
+        parser, received, batch = AppListParser(), 0, []
+        async for chunk in _iter_source_chunks(source):
+            batch.extend(await asyncio.to_thread(parser.feed, chunk))
+            if len(batch) >= BATCH_SIZE:
+                await db.run(database.stage_steam_apps, batch)
+                received += len(batch)
+                batch = []
+        parser.close()
+        if batch:
+            await db.run(database.stage_steam_apps, batch)
+            received += len(batch)
+        if not received:
+            raise ValueError("Получен пустой список приложений Steam")
+        report = await db.run(database.apply_steam_apps_staging)
+        report['received'] = received
+        report['peak_rss_mb'] = peak_rss_mb()
+        report['peak_rss_growth_mb'] = report['peak_rss_mb'] - peak_before
+        report['seconds'] = time.monotonic() - started
+    finally:
+        await db.run(database.drop_steam_apps_staging)
+    clear_resolver_cache()
+    print(f"INFO: Каталог Steam обновлен: получено {report['received']}, добавлено {report['added']}, "
+          f"переименовано {report['renamed']}, удалено {report['removed']}; "
+          f"пик RSS процесса {report['peak_rss_mb']:.1f} МБ (+{report['peak_rss_growth_mb']:.1f} МБ за обновление), {report['seconds']:.1f} с.")
+    return report
+
+# --- Поиск appid по названию игры ---
+# LRU-кэш хранит и отрицательные результаты: игры, которых нет в Steam, не ищутся повторно.
+MISSING = object()
+_resolver_cache = OrderedDict()
+resolver_stats = {"hits": 0, "misses": 0, "negative_hits": 0, "normalized_matches": 0, "fuzzy_matches": 0}
+metrics.add_collector("nexus_steam_resolver", resolver_stats)
+
+def cached_app_id(game_name):
+    """Возвращает appid (или None для известного промаха) из кэша, либо MISSING, если нужен поиск в БД."""
+    appid = _resolver_cache.get(game_name, MISSING)
+    if appid is MISSING:
+        resolver_stats["misses"] += 1
+        return MISSING
+    _resolver_cache.move_to_end(game_name)
+    resolver_stats["hits" if appid else "negative_hits"] += 1
+    return appid
+
+def remember_app_id(game_name, appid):
+    _resolver_cache[game_name] = appid
+    _resolver_cache.move_to_end(game_name)
+    while len(_resolver_cache) > config.STEAM_RESOLVER_CACHE_SIZE:
+        _resolver_cache.popitem(last=False)
+
+# Растет при каждой очистке кэша (обновлении каталога); входит в ключ фрагментов StatusRenderer
+generation = 0
+
+def clear_resolver_cache():
+    global generation
+    _resolver_cache.clear()
+    generation += 1
+
+def lookup_app_id(game_name):
+    """Ищет appid в БД (вызывать в потоке БД): точное имя, нормализованное имя, затем нечеткий поиск."""
+    appid = database.get_steam_app_id(game_name)
+    if appid:
+        return appid
+    norm_name = normalize_name(game_name)
+    if not norm_name:
+        return None
+    appid = database.get_steam_app_id_by_norm_name(norm_name)
+    if appid:
+        resolver_stats["normalized_matches"] += 1
+        return appid
+    if not config.STEAM_FUZZY_MATCH_ENABLED:
+        return None
+    candidates, numbers = {}, number_tokens(norm_name)
+    for candidate_appid, candidate_name in database.get_steam_app_candidates(norm_name.split()[0]):
+        if number_tokens(candidate_name) == numbers:
+            candidates.setdefault(candidate_name, candidate_appid)
+    match = difflib.get_close_matches(norm_name, candidates, n=1, cutoff=config.STEAM_FUZZY_MATCH_CUTOFF)
+    if match:
+        resolver_stats["fuzzy_matches"] += 1
+        return candidates[match[0]]
+    return None
+
+async def _main(source):
+    try:
+        await refresh_catalog(source)
+    finally:
+        await http_client.close()
+
+if __name__ == "__main__":
+    # python steam_catalog.py [URL или путь к файлу] - ручное обновление каталога
+    database.init_db()
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else None))
+    db.shutdown()
@@ -0,0 +1,80 @@
+# steam_presence.py
+"""Фоновый опрос Steam: текущая игра всех пользователей в войсе.
+
+Вместо запроса GetPlayerSummaries на каждое событие Discord поллер раз в интервал
+запрашивает сразу всех (до 100 steamid за запрос) и хранит результат в общей таблице,
+из которой читает discord_bot.update_user_status. При ошибках интервал растет.
+"""
+import asyncio
+import os
+import time
+
+import aiohttp
+
+import config
+import http_client
+
+STEAM_API_KEY = os.getenv('STEAM_API_KEY')
+PLAYER_SUMMARIES_URL = "http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/"
+MAX_IDS_PER_REQUEST = 100
+
+# steam_id -> название игры (None, если пользователь сейчас не в игре)
+current_games = {}
+_wakeup = None
+
+def get_current_game(steam_id):
+    return current_games.get(steam_id) if steam_id else None
+
+def request_refresh():
+    """Просит поллер обновить данные раньше срока (например, когда кто-то зашел в войс)."""
+    if _wakeup:
+        _wakeup.set()
+
+async def _fetch_games(steam_ids):
+    games = dict.fromkeys(steam_ids)
+    for i in range(0, len(steam_ids), MAX_IDS_PER_REQUEST):
+        chunk = steam_ids[i:i + MAX_IDS_PER_REQUEST]
+        data = await http_client.get_json(PLAYER_SUMMARIES_URL, params={"key": STEAM_API_KEY, "steamids": ",".join(chunk)})
+        for player in data.get("response", {}).get("players", []):
+            games[player.get("steamid")] = player.get("gameextrainfo")
+    return games
+
+async def run(get_steam_ids, on_poll):
+    """Цикл опроса. get_steam_ids() возвращает steamid пользователей в войсе,
+    on_poll(changed) вызывается после каждого успешного опроса с множеством изменившихся steamid."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    backoff = 0
+    while True:
+        if backoff:
+            # Во время ошибок Steam ранние запросы (request_refresh) не сокращают паузу
+            await asyncio.sleep(backoff)
+        else:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=config.STEAM_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        _wakeup.clear()
+        steam_ids = set(get_steam_ids())
+        for steam_id in current_games.keys() - steam_ids:
+            del current_games[steam_id]
+        if not steam_ids or not STEAM_API_KEY:
+            continue
+        started = time.monotonic()
+        try:
+            games = await _fetch_games(sorted(steam_ids))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            backoff = min(max(backoff * 2, config.STEAM_POLL_INTERVAL_SECONDS), config.STEAM_POLL_MAX_BACKOFF_SECONDS)
+            print(f"ERROR: Не удалось получить статусы Steam ({len(steam_ids)} игроков): {e}. Повтор через {backoff} с.")
+            continue
+        backoff = 0
+        changed = {steam_id for steam_id, game in games.items() if steam_id not in current_games or current_games[steam_id] != game}
+        current_games.update(games)
+        if changed:
+            print(f"INFO: Статусы Steam обновлены: {len(games)} игроков, изменилось {len(changed)}, {(time.monotonic() - started) * 1000:.0f} мс.")
+        try:
+            await on_poll(changed)
+        except Exception as e:
+            print(f"ERROR: Ошибка применения статусов Steam: {e}")
+        # Ранние обновления по request_refresh() не чаще, чем раз в STEAM_POLL_MIN_GAP_SECONDS
+        await asyncio.sleep(config.STEAM_POLL_MIN_GAP_SECONDS)
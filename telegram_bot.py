@@ -1,92 +1,80 @@
 # telegram_bot.py
 import os
-import psutil
 from datetime import datetime
 from telegram import Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram.constants import ParseMode
-from telegram.error import BadRequest
 import asyncio
 
-import database
+import async_database as db
+import health
+import journal
+import metrics
+import steam_catalog
 import utils
 import config
+from expiry import ExpiryWheel
 
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 app_instance = None 
-
-async def delete_message_job(context: ContextTypes.DEFAULT_TYPE):
-    try: await context.bot.delete_message(chat_id=context.job.data['chat_id'], message_id=context.job.data['message_id'])
-    except Exception: pass
-
-async def edit_countdown_job(context: ContextTypes.DEFAULT_TYPE):
-    job_data = context.job.data
-    footer = f"\n\n*🗑️ Сообщение исчезнет через {job_data['remaining_time']} секунд...*"
-    try:
-        await context.bot.edit_message_text(
-            text=job_data['base_text'] + footer,
-            chat_id=job_data['chat_id'], message_id=job_data['message_id'],
-            parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True
-        )
-    except BadRequest: pass
+expiry_wheel, expiry_task = None, None
 
 async def send_and_animate_delete(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, parse_mode=None):
     try: await update.message.delete()
     except Exception: pass
-    
-    footer = "\n\n*🗑️ Сообщение исчезнет через 60 секунд...*"
-    sent_message = await context.bot.send_message(
-        chat_id=update.effective_chat.id, text=text + footer,
-        parse_mode=parse_mode, disable_web_page_preview=True
-    )
-    
-    if context.job_queue:
-        base_data = {'chat_id': sent_message.chat_id, 'message_id': sent_message.message_id, 'base_text': text}
-        context.job_queue.run_once(edit_countdown_job, 30, data={**base_data, 'remaining_time': 30})
-        context.job_queue.run_once(edit_countdown_job, 50, data={**base_data, 'remaining_time': 10})
-        context.job_queue.run_once(delete_message_job, 60, data={'chat_id': sent_message.chat_id, 'message_id': sent_message.message_id})
+    await expiry_wheel.send(update.effective_chat.id, text, parse_mode=parse_mode)
+
+def _monitor_for_query(query):
+    from discord_bot import get_monitor_for_chat
+    monitor = get_monitor_for_chat(query.message.chat.id, query.message.message_id) if query.message else None
+    journal.record("callback", g=monitor.guild_id if monitor else None, u=query.from_user.id, f=query.from_user.first_name, d=query.data)
+    return monitor
 
 async def coming_soon_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from discord_bot import add_coming_soon_user, send_or_edit_message
     query = update.callback_query
+    monitor = _monitor_for_query(query)
+    if not monitor:
+        await query.answer()
+        return
     user = query.from_user
-    discord_id = database.get_discord_id_by_telegram_id(user.id)
+    discord_id = db.get_discord_id_by_telegram_id(user.id)
     if not discord_id:
         await query.answer("❌ Ваш Telegram не привязан к Discord.", show_alert=True)
         return
         
-    user_stats = database.get_user_stats(discord_id)
+    user_stats = await db.get_user_stats(discord_id)
     user_name = user_stats[1] if user_stats else user.first_name
 
     await query.answer("✅ Вы добавлены в список ожидания на 30 минут!", show_alert=False)
-    add_coming_soon_user(discord_id, user_name)
-    asyncio.create_task(send_or_edit_message())
+    monitor.add_coming_soon_user(discord_id, user_name)
+    asyncio.create_task(monitor.send_or_edit_message())
 
 async def refresh_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from discord_bot import send_or_edit_message
     query = update.callback_query
     await query.answer("Запущена принудительная проверка...")
-    asyncio.create_task(send_or_edit_message(force_creation=True))
+    if monitor := _monitor_for_query(query):
+        asyncio.create_task(monitor.send_or_edit_message(force_creation=True))
 
 async def daily_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from discord_bot import send_or_edit_message
     query = update.callback_query
     await query.answer("Загружаю статистику...")
-    asyncio.create_task(send_or_edit_message(mode="daily_stats"))
+    if monitor := _monitor_for_query(query):
+        asyncio.create_task(monitor.send_or_edit_message(mode="daily_stats"))
 
 async def back_to_main_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from discord_bot import send_or_edit_message
     query = update.callback_query
     await query.answer("Возвращаюсь к мониторингу...")
-    asyncio.create_task(send_or_edit_message(mode="main"))
+    if monitor := _monitor_for_query(query):
+        asyncio.create_task(monitor.send_or_edit_message(mode="main"))
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_and_animate_delete(update, context, "👋 Привет! Я бот для уведомлений о голосовой активности. Используйте /help.")
 
 async def up_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from discord_bot import repost_message
+    from discord_bot import get_monitors_for_chat
     await update.message.delete()
-    asyncio.create_task(repost_message())
+    for monitor in get_monitors_for_chat(update.effective_chat.id):
+        asyncio.create_task(monitor.repost_message())
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = ("📜 *Список доступных команд:*\n\n"
@@ -99,7 +87,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_and_animate_delete(update, context, help_text, parse_mode=ParseMode.MARKDOWN)
 
 async def time_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    top_users = database.get_top_users()
+    top_users = db.get_top_users()
     if not top_users: return await update.message.delete()
     lines = ["*🏆 Зал славы (Топ-15):*\n"]
     for i, (name, secs, telegram_id) in enumerate(top_users, 1):
@@ -108,38 +96,41 @@ async def time_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_and_animate_delete(update, context, "\n".join(lines), parse_mode=ParseMode.MARKDOWN)
 
 async def games_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    top_games = database.get_top_games()
+    top_games = db.get_top_games()
     if not top_games: return await update.message.delete()
     lines = ["*🎮 Топ-5 игр сервера:*\n"]
     for i, (name, secs) in enumerate(top_games, 1):
-        url = utils.get_steam_app_url(name)
+        url = await utils.get_steam_app_url(name)
         game_link = f"[{utils.escape_markdown(name)}]({url})" if url else utils.escape_markdown(name)
         lines.append(f"*{i}.* {game_link} - {utils.format_duration(secs)}")
     await send_and_animate_delete(update, context, "\n".join(lines), parse_mode=ParseMode.MARKDOWN)
 
 async def king_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    king = database.get_weekly_king()
+    king = db.get_weekly_king()
     if not king: return await update.message.delete()
     await send_and_animate_delete(update, context, f"👑 Нынешний король войса: *{utils.escape_markdown(king[0])}*!", parse_mode=ParseMode.MARKDOWN)
 
 async def mystats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    discord_id = database.get_discord_id_by_telegram_id(update.effective_user.id)
+    discord_id = db.get_discord_id_by_telegram_id(update.effective_user.id)
     if not discord_id: text = "❌ Ваш Telegram не привязан."
     else:
-        stats = database.get_user_stats(discord_id)
+        stats = await db.get_user_stats(discord_id)
         if not stats: text = "📊 У вас пока нет статистики."
         else:
             secs, name = stats
-            achievements = database.get_user_achievements(discord_id)
+            achievements = await db.get_user_achievements(discord_id)
             lines = [f"📊 *Статистика для {utils.escape_markdown(name)}:*\n", f"*Общее время:* {utils.format_duration(secs)}"]
+            rank = db.get_user_rank(discord_id)
+            if rank:
+                lines.append(f"*Место в зале славы:* {rank}")
             if achievements:
                 lines.append("\n*Достижения:*")
                 lines.extend([f"🏅 {ach}" for ach in achievements])
-            top_user_games = database.get_top_games_for_user(discord_id, limit=3)
+            top_user_games = await db.get_top_games_for_user(discord_id, limit=3)
             if top_user_games:
                 lines.append("\n*Любимые игры:*")
                 for game_name, game_secs in top_user_games:
-                    url = utils.get_steam_app_url(game_name)
+                    url = await utils.get_steam_app_url(game_name)
                     game_link = f"[{utils.escape_markdown(game_name)}]({url})" if url else utils.escape_markdown(game_name)
                     lines.append(f"• {game_link} - {utils.format_duration(game_secs)}")
             text = "\n".join(lines)
@@ -148,46 +139,79 @@ async def mystats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def confirm_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: text = "⚠️ Укажите код. `/confirm ABC-123`"
     else:
-        discord_id = database.find_discord_id_by_code(context.args[0].upper())
+        discord_id = await db.find_discord_id_by_code(context.args[0].upper())
         if not discord_id: text = "❌ Неверный или истекший код."
         else:
-            database.link_telegram_account(discord_id, update.effective_user.id)
-            database.delete_linking_code(context.args[0].upper())
+            await db.link_telegram_account(discord_id, update.effective_user.id)
+            await db.delete_linking_code(context.args[0].upper())
             text = "✅ Успех! Аккаунты связаны."
     await send_and_animate_delete(update, context, text)
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from discord_bot import client as discord_client
+    from discord_bot import client as discord_client, edit_scheduler, monitors, presence_stats
     if update.effective_user.id not in config.ADMIN_USER_IDS: return await update.message.delete()
-    start_time_iso = database.get_key_value('start_time')
-    start_time = datetime.fromisoformat(start_time_iso) if start_time_iso else datetime.now(utils.MOSCOW_TZ)
+    start_time = health.get('start_time') or datetime.now(utils.MOSCOW_TZ)
     uptime = utils.format_duration((datetime.now(utils.MOSCOW_TZ) - start_time).total_seconds())
-    process = psutil.Process(os.getpid()); cpu_usage = process.cpu_percent(interval=0.1); ram_usage = process.memory_info().rss / (1024 * 1024)
-    net_io = psutil.net_io_counters(); net_sent = net_io.bytes_sent / (1024 * 1024); net_recv = net_io.bytes_recv / (1024 * 1024)
-    db_size = os.path.getsize(database.DB_FILE) if os.path.exists(database.DB_FILE) else 0
-    total_voice_time = utils.format_duration(database.get_total_voice_time())
-    discord_ping = round(discord_client.latency * 1000) if discord_client.is_ready() else -1
-    telegram_ping = await utils.measure_telegram_ping(); steam_ping = await utils.measure_steam_ping()
+    # Нагрузка, пинги и сверка таблиц лидеров берутся из фоновых замеров (health.sample_periodically)
+    total_voice_time = utils.format_duration(db.get_total_voice_time())
     now = datetime.now(utils.MOSCOW_TZ)
+    resolver = steam_catalog.resolver_stats
+    leaderboard_mismatches = health.latest.get('leaderboard_mismatches')
+    net_sent, net_recv = health.latest.get('net_sent_mb', 0), health.latest.get('net_recv_mb', 0)
+    edits = edit_scheduler.stats
+    debounce = {key: sum(m.debouncer.stats[key] for m in monitors.values()) for key in ('events', 'renders', 'max_wait_hits')}
+    def format_latency(name, label=None):
+        histogram = metrics.merged(name)
+        if not histogram.count: return "нет данных"
+        text = f"{histogram.count} вызовов, среднее {histogram.sum / histogram.count * 1000:.1f} мс, p95 {histogram.format_quantile(0.95)}"
+        if label:
+            slowest = max(metrics.histograms(name), key=lambda item: item[1].quantile(0.95))
+            text += f", медленнее всего {utils.escape_markdown(slowest[0][label])}"
+        return text
+    def format_window(name, unit, digits=1):
+        summary = health.summary(name)
+        if not summary: return "нет данных"
+        return (f"{summary['last']:.{digits}f} {unit} {summary['trend']} (мин {summary['min']:.{digits}f}, "
+                f"сред {summary['avg']:.{digits}f}, p95 {summary['p95']:.{digits}f} за {config.HEALTH_WINDOW_MINUTES} мин)")
+    def format_api(name, key):
+        if health.latest.get(f"{name}_ping_ms_failed"): return "Ошибка"
+        return f"{format_window(f'{name}_ping_ms', 'мс', 0)}, {format_last_seen(key)}"
     def format_last_seen(key):
-        last_seen_iso = database.get_key_value(key)
-        if not last_seen_iso: return "никогда"
-        last_seen_time = datetime.fromisoformat(last_seen_iso)
+        last_seen_time = health.get(key)
+        if not last_seen_time: return "никогда"
         delta = (now - last_seen_time).total_seconds()
         return f"{int(delta)} сек. назад" if delta < 60 else utils.format_duration(delta) + " назад"
     lines = [
         "🤖 *Статус бота (v1.0)*", "", "**Технические данные:**",
-        f"- Аптайм: {uptime}", f"- Нагрузка CPU: {cpu_usage:.1f}%", f"- Память RAM: {ram_usage:.2f} МБ",
-        f"- Сеть (отправлено/получено): {net_sent:.2f} / {net_recv:.2f} МБ", "", "**API:**",
-        f"- Discord: {discord_ping} мс, {format_last_seen('last_discord_success')}" if discord_ping != -1 else "- Discord: Не подключен",
-        f"- Telegram: {int(telegram_ping)} мс, {format_last_seen('last_telegram_success')}" if telegram_ping !=-1 else "- Telegram: Ошибка",
-        f"- Steam: {int(steam_ping)} мс, {format_last_seen('last_steam_success')}" if steam_ping != -1 else "- Steam: Ошибка", "", "**Статистика базы данных:**",
-        f"- Размер БД: {db_size / (1024*1024):.2f} МБ", f"- Общее время в войсе: {total_voice_time}"
+        f"- Аптайм: {uptime}", f"- Нагрузка CPU: {format_window('cpu_percent', '%')}", f"- Память RAM: {format_window('rss_mb', 'МБ')}",
+        f"- Сеть (отправлено/получено): {net_sent:.2f} / {net_recv:.2f} МБ",
+        f"- Отправка: {format_window('net_sent_kbps', 'КБ/с')}", f"- Прием: {format_window('net_recv_kbps', 'КБ/с')}",
+        f"- Задержка цикла событий: {format_window('loop_lag_ms', 'мс')}", "", "**API:**",
+        f"- Discord: {format_api('discord', 'last_discord_success')}" if discord_client.is_ready() else "- Discord: Не подключен",
+        f"- Telegram: {format_api('telegram', 'last_telegram_success')}",
+        f"- Серверы: {len(monitors)}, чатов: {len({str(m.chat_id) for m in monitors.values()})}, в войсе: {sum(len(m.voice_users) for m in monitors.values())}",
+        f"- События присутствия: {presence_stats['received']} получено, {presence_stats['dropped']} отброшено, {presence_stats['throttled']} отложено, {presence_stats['acted']} обработано",
+        f"- Обновления статуса: {debounce['events']} событий → {debounce['renders']} отрисовок ({debounce['max_wait_hits']} по максимальному ожиданию)",
+        f"- Исчезающие ответы: {len(expiry_wheel)} ожидают, {expiry_wheel.stats['deleted']} удалено за {expiry_wheel.stats['delete_requests']} запросов, отсчет: {expiry_wheel.stats['countdown_edits']} правок, {expiry_wheel.stats['countdown_skipped']} пропущено",
+        f"- Правки статуса: {edits['edited']} отправлено, {edits['skipped']} пропущено, {edits['throttled']} задержано лимитом, {edits['retry_after']} RetryAfter",
+        f"- Steam: {format_api('steam', 'last_steam_success')}", "", "**Задержки:**",
+        f"- БД: {format_latency('nexus_db_query_seconds', 'function')}",
+        f"- Telegram API: {format_latency('nexus_telegram_request_seconds')}",
+        f"- HTTP (Steam): {format_latency('nexus_http_request_seconds', 'host')}",
+        f"- События Discord: {format_latency('nexus_discord_event_seconds', 'event')}",
+        f"- Отрисовка статуса: {format_latency('nexus_render_seconds')}", "", "**Статистика базы данных:**",
+        f"- Размер БД: {format_window('db_size_mb', 'МБ', 2)}", f"- Общее время в войсе: {total_voice_time}",
+        f"- Таблицы лидеров: {'еще не сверялись' if leaderboard_mismatches is None else 'согласованы с БД' if not leaderboard_mismatches else f'{leaderboard_mismatches} расхождений'}",
+        f"- Кэш игр Steam: {resolver['hits']} попаданий, {resolver['negative_hits']} известных промахов, {resolver['misses']} запросов к БД"
     ]
     await send_and_animate_delete(update, context, "\n".join(lines), parse_mode=ParseMode.MARKDOWN)
 
 async def run():
-    global app_instance
+    global app_instance, expiry_wheel, expiry_task
+    from discord_bot import edit_scheduler
+    expiry_wheel = ExpiryWheel(edit_scheduler)
+    await expiry_wheel.load()
+    expiry_task = asyncio.create_task(expiry_wheel.run())
     app_instance = Application.builder().token(TELEGRAM_TOKEN).build()
     handlers = [CommandHandler(cmd, func) for cmd, func in [
         ("start", start), ("help", help_command), ("time", time_command),
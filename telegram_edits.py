@@ -0,0 +1,118 @@
+# telegram_edits.py
+"""Отправка и редактирование сообщений Telegram с учетом лимитов.
+
+Планировщик помнит хэш последнего текста и клавиатуры каждого сообщения и не отправляет
+правки, которые ничего не меняют. Запросы в один чат проходят через корзину токенов
+(лимиты Telegram для групп: около 20 сообщений в минуту), а ответ RetryAfter выдерживается
+и запрос повторяется.
+"""
+import asyncio
+import hashlib
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+import config
+import metrics
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate, self.capacity = rate_per_second, capacity
+        self.tokens, self.updated = float(capacity), time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        """Есть ли токен для запроса без ожидания (токен не забирается)."""
+        self._refill()
+        return self.tokens >= 1
+
+    def reserve(self):
+        """Забирает токен и возвращает, сколько секунд нужно подождать перед запросом."""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class EditScheduler:
+    def __init__(self, bot):
+        self.bot = bot
+        self._hashes = {}
+        self._buckets = {}
+        self.stats = {"sent": 0, "edited": 0, "skipped": 0, "throttled": 0, "retry_after": 0}
+
+    @staticmethod
+    def _fingerprint(text, reply_markup):
+        markup = reply_markup.to_json() if reply_markup else ""
+        return hashlib.blake2b(f"{text}\0{markup}".encode(), digest_size=16).digest()
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(config.TELEGRAM_CHAT_MESSAGES_PER_MINUTE / 60, config.TELEGRAM_CHAT_BURST)
+        return bucket
+
+    def has_capacity(self, chat_id):
+        """Можно ли отправить запрос в чат сейчас, не дожидаясь лимита (для необязательных правок)."""
+        return self._bucket(chat_id).available()
+
+    async def _acquire(self, chat_id):
+        delay = self._bucket(chat_id).reserve()
+        if delay > 0:
+            self.stats["throttled"] += 1
+            await asyncio.sleep(delay)
+
+    async def _call(self, chat_id, method, *args, limited=True, **kwargs):
+        for attempt in range(config.TELEGRAM_RETRY_AFTER_MAX_ATTEMPTS):
+            if limited:
+                await self._acquire(chat_id)
+            try:
+                with metrics.timer("nexus_telegram_request_seconds", method=method.__name__):
+                    return await method(*args, **kwargs)
+            except RetryAfter as e:
+                self.stats["retry_after"] += 1
+                if attempt + 1 >= config.TELEGRAM_RETRY_AFTER_MAX_ATTEMPTS:
+                    raise
+                print(f"INFO: Telegram просит подождать {e.retry_after} с. перед запросом в чат {chat_id}.")
+                await asyncio.sleep(e.retry_after)
+
+    async def send(self, chat_id, text, reply_markup=None, **kwargs):
+        message = await self._call(chat_id, self.bot.send_message, chat_id, text, reply_markup=reply_markup, **kwargs)
+        self._hashes[(chat_id, message.message_id)] = self._fingerprint(text, reply_markup)
+        self.stats["sent"] += 1
+        return message
+
+    async def edit(self, chat_id, message_id, text, reply_markup=None, **kwargs):
+        """Редактирует сообщение. Возвращает False, если правка пропущена как не меняющая сообщение."""
+        key = (chat_id, message_id)
+        fingerprint = self._fingerprint(text, reply_markup)
+        if self._hashes.get(key) == fingerprint:
+            self.stats["skipped"] += 1
+            return False
+        try:
+            await self._call(chat_id, self.bot.edit_message_text, text, chat_id, message_id, reply_markup=reply_markup, **kwargs)
+        except BadRequest as e:
+            if "message is not modified" not in str(e).lower():
+                raise
+            self.stats["skipped"] += 1
+            self._hashes[key] = fingerprint
+            return False
+        self._hashes[key] = fingerprint
+        self.stats["edited"] += 1
+        return True
+
+    async def delete(self, chat_id, message_ids):
+        """Удаляет сообщения чата пачками по 100 (один запрос deleteMessages на пачку).
+
+        Удаление не расходует лимит отправки сообщений в чат, но RetryAfter соблюдается.
+        """
+        for i in range(0, len(message_ids), 100):
+            chunk = message_ids[i:i + 100]
+            await self._call(chat_id, self.bot.delete_messages, chat_id, chunk, limited=False)
+            for message_id in chunk:
+                self.forget(chat_id, message_id)
+
+    def forget(self, chat_id, message_id):
+        self._hashes.pop((chat_id, message_id), None)
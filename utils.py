@@ -1,57 +1,73 @@
 # utils.py
+import asyncio
 import os
-import requests
+import aiohttp
 from datetime import datetime, timezone, timedelta
 import re
 import urllib.parse
-import time
-import database
+import async_database as db
 import config
+import http_client
+import metrics
+import steam_catalog
 
 MOSCOW_TZ = timezone(timedelta(hours=3))
-STEAM_API_KEY = os.getenv('STEAM_API_KEY')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 
 async def fetch_steam_app_list_to_db():
-    last_updated = database.get_cache_last_updated('steam_apps')
+    last_updated = await db.get_cache_last_updated('steam_apps')
     if not last_updated or (datetime.now() - last_updated) > timedelta(days=7):
         print("INFO: Кэш игр Steam устарел или отсутствует. Обновляю...")
         try:
-            url = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
-            response = requests.get(url, timeout=15).json()
-            apps = response.get('applist', {}).get('apps', [])
-            if apps:
-                app_data = [(app['appid'], app['name']) for app in apps]
-                database.update_steam_apps(app_data)
-                database.set_cache_last_updated('steam_apps')
-        except requests.RequestException as e:
+            await steam_catalog.refresh_catalog()
+            await db.set_cache_last_updated('steam_apps')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, OSError) as e:
             print(f"!!! КРИТИЧЕСКАЯ ОШИБКА: Не удалось загрузить список игр Steam: {e}")
     else:
         print("INFO: Кэш игр Steam актуален. Пропускаю обновление.")
 
-def get_steam_app_url(game_name):
+async def get_steam_app_url(game_name):
     if not game_name or game_name == "Неизвестно":
         return None
-    appid = database.get_steam_app_id(game_name)
+    appid = steam_catalog.cached_app_id(game_name)
+    if appid is steam_catalog.MISSING:
+        appid = await db.run(steam_catalog.lookup_app_id, game_name)
+        steam_catalog.remember_app_id(game_name, appid)
     return f"https://store.steampowered.com/app/{appid}/" if appid else None
 
 async def measure_telegram_ping():
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getMe"
-    start_time = time.monotonic()
-    try:
-        requests.get(url, timeout=5)
-        return (time.monotonic() - start_time) * 1000
-    except requests.RequestException:
-        return -1
+    return await http_client.measure_latency(f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getMe")
 
 async def measure_steam_ping():
-    url = "https://api.steampowered.com/ISteamWebAPIUtil/GetServerInfo/v1/"
-    start_time = time.monotonic()
-    try:
-        requests.get(url, timeout=5)
-        return (time.monotonic() - start_time) * 1000
-    except requests.RequestException:
-        return -1
+    return await http_client.measure_latency("https://api.steampowered.com/ISteamWebAPIUtil/GetServerInfo/v1/")
+
+# Сводка задержек цикла событий с момента последнего отчета (заполняется monitor_loop_lag)
+loop_lag_stats = {"samples": 0, "total_ms": 0.0, "max_ms": 0.0, "blocked_ms": 0.0}
+metrics.add_collector("nexus_loop_lag", loop_lag_stats)
+
+async def monitor_loop_lag():
+    """Измеряет, насколько позже запланированного просыпается цикл событий, и периодически пишет сводку в лог."""
+    interval = config.LOOP_LAG_MONITOR_INTERVAL
+    if not interval:
+        return
+    loop = asyncio.get_running_loop()
+    last_report = loop.time()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        now = loop.time()
+        lag_ms = max(0.0, (now - started - interval) * 1000)
+        loop_lag_stats["samples"] += 1
+        loop_lag_stats["total_ms"] += lag_ms
+        loop_lag_stats["max_ms"] = max(loop_lag_stats["max_ms"], lag_ms)
+        if lag_ms >= config.LOOP_LAG_BLOCKED_THRESHOLD_MS:
+            loop_lag_stats["blocked_ms"] += lag_ms
+        if now - last_report >= config.LOOP_LAG_REPORT_SECONDS:
+            samples = loop_lag_stats["samples"]
+            print(f"INFO: Задержка цикла событий: средняя {loop_lag_stats['total_ms'] / samples:.1f} мс, "
+                  f"максимум {loop_lag_stats['max_ms']:.1f} мс, заблокирован {loop_lag_stats['blocked_ms']:.0f} мс за {samples} замеров.")
+            loop_lag_stats.update(samples=0, total_ms=0.0, max_ms=0.0, blocked_ms=0.0)
+            last_report = now
 
 def get_day_start_time():
     return datetime.now(MOSCOW_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
@@ -76,16 +92,6 @@ def is_quiet_hours():
     start, end = config.QUIET_HOURS["start"], config.QUIET_HOURS["end"]
     return start <= now_hour < end if start < end else now_hour >= start or now_hour < end
 
-def get_game_from_steam(steam_id):
-    if not steam_id or not STEAM_API_KEY: return None
-    try:
-        url = f"http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/?key={STEAM_API_KEY}&steamids={steam_id}"
-        response = requests.get(url, timeout=5).json()
-        player = response.get("response", {}).get("players", [{}])[0]
-        return player.get("gameextrainfo")
-    except requests.RequestException:
-        return None
-
 def escape_markdown(text: str) -> str:
     escape_chars = r'\_*[]()~`>#+-.=|{}!'
     return re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', text)